@@ -6,6 +6,9 @@ part 'property_listing_model.g.dart';
 class PropertyListing {
   final int id;
   final String title;
+
+  // list endpoints send compact cards without the description
+  @JsonKey(defaultValue: '')
   final String description;
   final double price;
 
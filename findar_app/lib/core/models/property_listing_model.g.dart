@@ -10,7 +10,7 @@ PropertyListing _$PropertyListingFromJson(Map<String, dynamic> json) =>
     PropertyListing(
       id: (json['id'] as num).toInt(),
       title: json['title'] as String,
-      description: json['description'] as String,
+      description: json['description'] as String? ?? '',
       price: (json['price'] as num).toDouble(),
       location: json['address'] as String? ?? 'Unknown',
       bedrooms: (json['bedrooms'] as num).toInt(),
@@ -6,6 +6,10 @@ import 'package:findar/core/services/cloudinary_service.dart';
 import 'package:findar/core/config/api_config.dart';
 
 class RemoteListingRepository implements ListingRepository {
+  /// advanced search page size and max number of pages fetched per search
+  static const int searchPageSize = 50;
+  static const int searchMaxPages = 4;
+
   final FindarApiService apiService;
   final CloudinaryService cloudinaryService;
 
@@ -355,20 +359,35 @@ class RemoteListingRepository implements ListingRepository {
       if (listedBy != null) queryParams['listed_by'] = listedBy;
       if (sortBy != null) queryParams['sort_by'] = sortBy;
 
+      // results come in pages, follow the `next` cursor up to a bounded number of pages
+      queryParams['page_size'] = searchPageSize.toString();
+
       print('Filter params: $queryParams');
 
-      final response = await apiService.get(
-        ApiConfig.advancedSearch,
-        queryParams: queryParams.isNotEmpty ? queryParams : null,
-      );
+      final listings = <PropertyListing>[];
+      for (var page = 0; page < searchMaxPages; page++) {
+        final response = await apiService.get(
+          ApiConfig.advancedSearch,
+          queryParams: queryParams,
+        );
 
-      print('Filtered listings response: $response');
+        // older backends ignore page_size and return the whole list
+        if (response is List) {
+          return _parseListingList(response);
+        }
+        if (response is! Map) break;
 
-      if (response is List) {
-        return _parseListingList(response);
+        final results = response['results'];
+        if (results is List) {
+          listings.addAll(_parseListingList(results));
+        }
+        final next = response['next'];
+        if (next == null) break;
+        queryParams['cursor'] = next;
       }
 
-      return <PropertyListing>[];
+      print('Filtered listings: ${listings.length} results');
+      return listings;
     } catch (e) {
       print('Error fetching filtered listings: $e');
       return <PropertyListing>[];
@@ -36,6 +36,8 @@ class BoostCubit extends Cubit<Map<String, dynamic>> {
           'card_holder': cardHolder,
           'expiry_date': expiryDate,
           'cvv': cvv,
+          'plan': planId,
+          'duration_months': durationMonths,
         },
       );
 
@@ -9,3 +9,5 @@ admin.site.register(Report)
 admin.site.register(BoostingPlan)
 admin.site.register(Boosting)
 admin.site.register(DeviceToken)
+admin.site.register(NotificationOutbox)
+admin.site.register(EmailOutbox)
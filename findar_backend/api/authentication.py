@@ -0,0 +1,110 @@
+import copy
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.utils.functional import LazyObject
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+"""
+    stateless JWT authentication
+    most views only need request.user.id, so the user is built from the token claims
+    and only loaded from the database (through a short lived in-process cache) when
+    another attribute is read; query by user_id=request.user.id instead of passing
+    request.user to the ORM, which loads it
+"""
+
+USER_CACHE_TTL = getattr(settings, 'JWT_USER_CACHE_TTL', 30)  # seconds
+USER_CACHE_MAX_SIZE = 10000
+
+_user_cache = {}
+_user_cache_lock = threading.Lock()
+
+
+def get_cached_user(user_id):
+    """the user with user_id , None if it doesn't exist (anymore)"""
+    now = time.monotonic()
+    entry = _user_cache.get(user_id)
+    if entry is not None and entry[0] > now:
+        user = entry[1]
+    else:
+        user = get_user_model().objects.filter(id=user_id).first()
+        with _user_cache_lock:
+            if len(_user_cache) >= USER_CACHE_MAX_SIZE:
+                _user_cache.clear()
+            _user_cache[user_id] = (now + USER_CACHE_TTL, user)
+    # every request gets its own copy , the cached instance is never mutated
+    return copy.copy(user)
+
+
+def forget_cached_user(user_id):
+    """called after a user is saved , the other processes catch up after USER_CACHE_TTL"""
+    with _user_cache_lock:
+        _user_cache.pop(user_id, None)
+
+
+class LazyTokenUser(LazyObject):
+    """the user of a token , loaded on the first access to an attribute the claims don't carry"""
+
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, user_id, account_type=None):
+        super().__init__()
+        # LazyObject forwards setattr to the wrapped user , write to __dict__ directly
+        self.__dict__['_user_id'] = user_id
+        self.__dict__['_account_type'] = account_type
+
+    @property
+    def id(self):
+        return self._user_id
+
+    pk = id
+
+    def __bool__(self):
+        # permission classes test `request.user and ...`
+        return True
+
+    @property
+    def account_type(self):
+        if self._account_type is None:
+            return self.__getattr__('account_type')
+        return self._account_type
+
+    def _setup(self):
+        user = get_cached_user(self._user_id)
+        if user is None or not user.is_active:
+            raise AuthenticationFailed("User not found", code="user_not_found")
+        self._wrapped = user
+
+
+class StatelessJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication without the user query of every request"""
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken("Token contained no recognizable user identification")
+        # recent simplejwt versions store the claim as a string , views compare it with owner_id
+        user_id = get_user_model()._meta.pk.to_python(user_id)
+        return LazyTokenUser(user_id, validated_token.get('account_type'))
+
+
+class UserRefreshToken(RefreshToken):
+    """refresh token carrying the claims LazyTokenUser serves , copied to its access tokens"""
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        token['account_type'] = user.account_type
+        return token
+
+
+class UserTokenObtainPairSerializer(TokenObtainPairSerializer):
+    token_class = UserRefreshToken
@@ -0,0 +1,301 @@
+import hashlib
+import json
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import timedelta
+
+from django.core.cache import cache, caches
+from django.core.cache.backends.db import DatabaseCache
+from django.db.models import F
+from django.utils import timezone
+
+"""
+    shared cache helpers (django cache framework, see CACHES in settings)
+    every write on a post goes through listing_changed() so the cached
+    feeds never outlive the data they were built from , except the search
+    results : they live a minute and are re-filtered when the page is fetched
+"""
+
+SPONSORED_FEED_KEY = 'listings:sponsored'
+SPONSORED_FEED_TIMEOUT = 60 * 5  # safety net , the feed is invalidated on every change
+
+LISTING_DETAIL_KEY = 'listings:detail:{}'
+LISTING_DETAIL_TIMEOUT = 60 * 60
+# changed to drop every cached detail at once (entries of another generation are misses)
+LISTING_DETAIL_GENERATION_KEY = 'listings:detail:generation'
+
+# not invalidated by writes (any write would flush every search) , the ids are only
+# kept SEARCH_CACHE_TIMEOUT seconds and the page is fetched with the search filters,
+# so a post that no longer matches (deactivated , deleted , edited) is left out
+SEARCH_RESULTS_KEY = 'search:{}'
+SEARCH_CACHE_TIMEOUT = 60
+SEARCH_CACHE_MAX_RESULTS = 1000
+
+PROFILE_HEADER_KEY = 'profile:header:{}'
+PROFILE_HEADER_TIMEOUT = 60 * 60
+
+SAVED_IDS_KEY = 'saved:ids:{}'
+SAVED_IDS_TIMEOUT = 60 * 60
+
+COUNTER_PREFIX = 'counter:'
+COUNTER_FLUSH_INTERVAL = 60  # seconds , counters buffered in the process (database cache)
+
+# last_active is written at most once per window and user
+LAST_ACTIVE_THROTTLE = 60 * 15
+LAST_ACTIVE_MAX_USERS = 10000
+
+
+################# counters
+
+_pending_counters = Counter()
+_counters_lock = threading.Lock()
+_counters_flushed_at = time.monotonic()
+
+
+def atomic_counters():
+    """
+    redis (and the per-process locmem cache) increment in one atomic call , the database
+    cache needs a get and a set (several queries) on one hot row every worker writes to
+    """
+    return not isinstance(caches['default'], DatabaseCache)
+
+
+def incr_counter(name, amount=1):
+    global _counters_flushed_at
+
+    if atomic_counters():
+        key = COUNTER_PREFIX + name
+        # add() is atomic , it only fails when the counter already exists
+        if not cache.add(key, amount, timeout=None):
+            try:
+                cache.incr(key, amount)
+            except ValueError:
+                # evicted between add() and incr()
+                cache.set(key, amount, timeout=None)
+        return
+
+    # buffered , written in one batch every COUNTER_FLUSH_INTERVAL seconds per process
+    with _counters_lock:
+        _pending_counters[name] += amount
+        due = time.monotonic() - _counters_flushed_at >= COUNTER_FLUSH_INTERVAL
+    if due:
+        flush_counters()
+
+
+def flush_counters():
+    """
+    adds the counts buffered by this process to the cached counters,
+    concurrent flushes of several processes can lose counts , they are approximate
+    """
+    global _counters_flushed_at
+
+    with _counters_lock:
+        pending = dict(_pending_counters)
+        _pending_counters.clear()
+        _counters_flushed_at = time.monotonic()
+    if not pending:
+        return
+    keys = {COUNTER_PREFIX + name: amount for name, amount in pending.items()}
+    current = cache.get_many(list(keys))
+    cache.set_many({key: current.get(key, 0) + amount for key, amount in keys.items()}, timeout=None)
+
+
+def get_counters(names):
+    flush_counters()
+    values = cache.get_many([COUNTER_PREFIX + name for name in names])
+    return {name: values.get(COUNTER_PREFIX + name, 0) for name in names}
+
+
+CACHE_COUNTERS = (
+    'sponsored_feed.hit',
+    'sponsored_feed.miss',
+    'listing_detail.hit',
+    'listing_detail.miss',
+    'listing_detail.not_modified',
+    'search.hit',
+    'search.miss',
+    'profile_header.hit',
+    'profile_header.miss',
+    'saved_ids.hit',
+    'saved_ids.miss',
+    'saved_ids.not_modified',
+)
+
+
+################# sponsored feed
+
+def get_sponsored_feed(build):
+    """returns the serialized sponsored feed , build() is only called on a miss"""
+    feed = cache.get(SPONSORED_FEED_KEY)
+    if feed is not None:
+        incr_counter('sponsored_feed.hit')
+        return feed
+    incr_counter('sponsored_feed.miss')
+    feed = build()
+    cache.set(SPONSORED_FEED_KEY, feed, SPONSORED_FEED_TIMEOUT)
+    return feed
+
+
+def invalidate_sponsored_feed():
+    cache.delete(SPONSORED_FEED_KEY)
+
+
+################# listing details
+
+def listing_etag(post):
+    return f'"{post.id}-{post.version}"'
+
+
+def get_listing_detail(listing_id, build):
+    """
+    returns the cached {"etag", "active", "data"} entry of a listing,
+    build() returns the entry on a miss (None when the listing doesn't exist)
+    """
+    key = LISTING_DETAIL_KEY.format(listing_id)
+    # one round trip for the entry and the current generation
+    values = cache.get_many([key, LISTING_DETAIL_GENERATION_KEY])
+    generation = values.get(LISTING_DETAIL_GENERATION_KEY, 0)
+    entry = values.get(key)
+    if entry is not None and entry.get("generation", 0) == generation:
+        incr_counter('listing_detail.hit')
+        return entry
+    incr_counter('listing_detail.miss')
+    entry = build()
+    if entry is not None:
+        entry = {**entry, "generation": generation}
+        cache.set(key, entry, LISTING_DETAIL_TIMEOUT)
+    return entry
+
+
+def invalidate_listing_details(listing_ids):
+    cache.delete_many([LISTING_DETAIL_KEY.format(listing_id) for listing_id in listing_ids])
+
+
+def invalidate_all_listing_details():
+    # a new random generation , set() is atomic where incr() isn't on every backend
+    cache.set(LISTING_DETAIL_GENERATION_KEY, uuid.uuid4().hex, timeout=None)
+
+
+################# search results
+
+def search_cache_key(params):
+    """key of a search , params must already be normalized (types , case , rounding)"""
+    canonical = json.dumps(params, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha1(canonical.encode()).hexdigest()
+
+
+def get_search_results(search_key, build):
+    """
+    returns the cached ordered [(sort_key, id), ...] of a search,
+    build() returns them on a miss (at most SEARCH_CACHE_MAX_RESULTS + 1 pairs)
+    """
+    key = SEARCH_RESULTS_KEY.format(search_key)
+    results = cache.get(key)
+    if results is not None:
+        incr_counter('search.hit')
+        return results
+    incr_counter('search.miss')
+    results = build()
+    cache.set(key, results, SEARCH_CACHE_TIMEOUT)
+    return results
+
+
+################# profiles
+
+def get_profile_header(user_id, build):
+    """returns the cached profile header of a user , build() returns it on a miss (None if the user doesn't exist)"""
+    key = PROFILE_HEADER_KEY.format(user_id)
+    header = cache.get(key)
+    if header is not None:
+        incr_counter('profile_header.hit')
+        return header
+    incr_counter('profile_header.miss')
+    header = build()
+    if header is not None:
+        cache.set(key, header, PROFILE_HEADER_TIMEOUT)
+    return header
+
+
+def invalidate_profile_header(user_id):
+    cache.delete(PROFILE_HEADER_KEY.format(user_id))
+
+
+################# saved posts
+
+def get_saved_ids(user_id, build):
+    """returns the cached {"etag", "ids"} of the posts saved by a user , build() returns the ids on a miss"""
+    key = SAVED_IDS_KEY.format(user_id)
+    entry = cache.get(key)
+    if entry is not None:
+        incr_counter('saved_ids.hit')
+        return entry
+    incr_counter('saved_ids.miss')
+    ids = build()
+    digest = hashlib.sha1(json.dumps(ids).encode()).hexdigest()[:16]
+    entry = {"etag": f'"{user_id}-{digest}"', "ids": ids}
+    cache.set(key, entry, SAVED_IDS_TIMEOUT)
+    return entry
+
+
+def invalidate_saved_ids(user_id):
+    cache.delete(SAVED_IDS_KEY.format(user_id))
+
+
+################# invalidation
+
+def listing_changed(post_id, owner_id, boosted, saved_by=()):
+    """
+    called after a post is saved or deleted , boosted : the post is or was boosted
+    saved_by : the users who had saved a deleted post
+    """
+    invalidate_listing_details([post_id])
+    if saved_by:
+        cache.delete_many([SAVED_IDS_KEY.format(user_id) for user_id in saved_by])
+    # the listings count of the owner's profile
+    invalidate_profile_header(owner_id)
+    # a post only enters or leaves the sponsored feed when it is or was boosted
+    # (bulk un-boosting must call invalidate_sponsored_feed itself)
+    if boosted:
+        invalidate_sponsored_feed()
+
+
+def owner_changed(owner_id):
+    """called after a user edits the profile shown in the owner details of their posts"""
+    from .models import Post
+
+    posts = Post.objects.filter(owner_id=owner_id)
+    listing_ids = list(posts.values_list('id', flat=True))
+    posts.update(version=F('version') + 1)
+    invalidate_listing_details(listing_ids)
+
+
+################# activity
+
+_last_active_written = {}
+_last_active_lock = threading.Lock()
+
+
+def touch_last_active(user_id):
+    """
+    records the activity of a user (login , token refresh), a no-op when this process
+    already recorded it in the last LAST_ACTIVE_THROTTLE seconds
+    """
+    from .models import CustomUser
+
+    now = time.monotonic()
+    with _last_active_lock:
+        if now - _last_active_written.get(user_id, -LAST_ACTIVE_THROTTLE) < LAST_ACTIVE_THROTTLE:
+            return
+        if len(_last_active_written) >= LAST_ACTIVE_MAX_USERS:
+            _last_active_written.clear()
+        _last_active_written[user_id] = now
+
+    # the other processes are throttled by the condition , the UPDATE matches no row
+    # when the activity was recorded recently
+    active_at = timezone.now()
+    CustomUser.objects.filter(
+        id=user_id,
+        last_active__lt=active_at - timedelta(seconds=LAST_ACTIVE_THROTTLE),
+    ).update(last_active=active_at)
@@ -3,50 +3,127 @@ from django.dispatch import receiver
 from .models import Boosting, CustomUser
 
 def check_almost_expired_boostings():
-    from .models import Post
-    from .services import reminder_boosting_expiry_notification
+    from .models import DeviceToken, NotificationOutbox
+    from .services import boosting_expiry_reminder
+    from django.db import transaction
     from django.utils import timezone
     from datetime import timedelta
 
     now = timezone.now()
     reminder_threshold = now + timedelta(days=1)
 
-    almost_expired_posts = Boosting.objects.filter(
-        expires_at__lte=reminder_threshold,
-        expires_at__gt=now,
-        notified = False
+    # claim the due boostings atomically , rows locked by a concurrent run are skipped
+    # so each reminder is queued once even if two runs overlap
+    # the reminders are queued in the same transaction , the send_notifications worker
+    # delivers and retries them , a failed send can't lose a claimed reminder
+    with transaction.atomic():
+        claimed = list(
+            Boosting.objects
+            .select_for_update(skip_locked=True, of=('self',))
+            .filter(
+                expires_at__lte=reminder_threshold,
+                expires_at__gt=now,
+                notified=False,
+            )
+            .values_list('id', 'post_id', 'post__owner_id')
+        )
+        if not claimed:
+            return
+
+        # the devices of every owner in one query
+        owner_tokens = {}
+        devices = DeviceToken.objects.filter(
+            user_id__in={owner_id for _, _, owner_id in claimed}
+        ).values_list('user_id', 'token')
+        for user_id, token in devices:
+            owner_tokens.setdefault(user_id, []).append(token)
+
+        reminders = []
+        for _, post_id, owner_id in claimed:
+            title, body, data = boosting_expiry_reminder(post_id)
+            reminders += [
+                NotificationOutbox(target_type='token', target=token, title=title, body=body, data=data)
+                for token in owner_tokens.get(owner_id, [])
+            ]
+        NotificationOutbox.objects.bulk_create(reminders)
+        Boosting.objects.filter(id__in=[boosting_id for boosting_id, _, _ in claimed]).update(notified=True)
+
+def expire_boostings():
+    from .cache import invalidate_all_listing_details, invalidate_sponsored_feed
+    from .models import Post
+    from django.db.models import Exists, F, OuterRef
+    from django.utils import timezone
+
+    now = timezone.now()
+
+    # posts with a boosting that expired and none still running
+    # (posts boosted without a Boosting row are left alone) , a single UPDATE ... WHERE
+    boostings = Boosting.objects.filter(post=OuterRef('pk'))
+    expired = (
+        Post.objects
+        .filter(boosted=True)
+        .filter(Exists(boostings.filter(expires_at__lte=now)))
+        .exclude(Exists(boostings.filter(expires_at__gt=now)))
+        .update(boosted=False, version=F('version') + 1)
     )
 
-    almost_expired_posts.update(notified=True)
+    # the ids aren't read back , the caches showing the boosted flag are dropped wholesale
+    if expired:
+        invalidate_sponsored_feed()
+        invalidate_all_listing_details()
 
-    for post in almost_expired_posts:
-        user = post.owner
-        device_tokens = user.devicetoken_set.all()
-        for token_obj in device_tokens:
-            reminder_boosting_expiry_notification(token_obj.token, post.id)
+ENGAGEMENT_REMINDER_INTERVAL_DAYS = 7
 
 def engagement_reminder():
-    from .models import CustomUser ,DeviceToken
-    from .services import send_user_notification
+    from .models import CustomUser, DeviceToken
+    from .services import FCM_MULTICAST_LIMIT, send_multicast_notification
+    from django.db.models import F, Q
     from django.utils import timezone
     from datetime import timedelta
 
     now = timezone.now()
     engagement_threshold = now - timedelta(days=1)
+    reminder_threshold = now - timedelta(days=ENGAGEMENT_REMINDER_INTERVAL_DAYS)
 
-    users_to_remind = CustomUser.objects.filter(
-        last_active__lte=engagement_threshold
+    title = "We miss you at FinDAR!"
+    body = "It's been a while since your last engagement. Check out new listings today!"
+
+    # inactive users (last_active index) not reminded since they were last active,
+    # or not in the last ENGAGEMENT_REMINDER_INTERVAL_DAYS days
+    devices = (
+        DeviceToken.objects
+        .filter(user__last_active__lte=engagement_threshold)
+        .filter(
+            Q(user__last_engagement_reminder_at__isnull=True) |
+            Q(user__last_engagement_reminder_at__lt=F('user__last_active')) |
+            Q(user__last_engagement_reminder_at__lte=reminder_threshold)
+        )
+        .order_by('id')
+        .values_list('user_id', 'token')
+        # streamed from the database , the memory stays constant
+        .iterator(chunk_size=FCM_MULTICAST_LIMIT)
     )
 
-    for user in users_to_remind:
-        device_tokens = DeviceToken.objects.filter(user=user)
-        for device_token in device_tokens:
-            try:
-                send_user_notification(
-                    device_token.token,
-                    "We miss you at FinDAR!",
-                    "It's been a while since your last engagement. Check out new listings today!"
-                )
-            except DeviceToken.DoesNotExist:
-                continue
+    def send(batch):
+        send_multicast_notification([token for _, token in batch], title, body)
+        CustomUser.objects.filter(id__in={user_id for user_id, _ in batch}).update(
+            last_engagement_reminder_at=now
+        )
+
+    batch = []
+    for device in devices:
+        batch.append(device)
+        if len(batch) == FCM_MULTICAST_LIMIT:
+            send(batch)
+            batch = []
+    if batch:
+        send(batch)
+
+def purge_password_reset_codes():
+    from .models import OTP_EXPIRATION_MINUTES, PasswordResetOTP
+    from django.db.models import Q
+    from django.utils import timezone
+    from datetime import timedelta
 
+    expired = timezone.now() - timedelta(minutes=OTP_EXPIRATION_MINUTES)
+    PasswordResetOTP.objects.filter(Q(created_at__lt=expired) | Q(used=True)).delete()
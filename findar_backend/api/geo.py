@@ -0,0 +1,135 @@
+import math
+
+from django.db.models import F, Q
+from django.db.models.functions import ACos, Cos, Greatest, Least, Radians, Sin
+
+"""
+    geo helpers for the location based search
+    the geohash cells and the bounding box are cheap, index friendly prefilters
+    and the exact great-circle distance is only computed for the rows inside them
+"""
+
+EARTH_RADIUS_KM = 6371
+DEFAULT_RADIUS_KM = 20
+MAX_RADIUS_KM = 200
+SEARCH_GRID_DECIMALS = 3  # searched coordinates are rounded to ~100m before caching
+
+GEOHASH_PRECISION = 9  # ~4.8m x 4.8m cells, stored on every post
+GEOHASH_MAX_CELLS = 16  # max number of prefixes a nearby search is split into
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def bounding_box(latitude, longitude, radius_km):
+    """returns (min_lat, max_lat, min_lng, max_lng) of a box containing the circle"""
+    lat_delta = math.degrees(radius_km / EARTH_RADIUS_KM)
+    min_lat = max(latitude - lat_delta, -90.0)
+    max_lat = min(latitude + lat_delta, 90.0)
+
+    # a degree of longitude shrinks towards the poles, use the widest latitude of the box
+    widest = max(abs(min_lat), abs(max_lat))
+    if widest >= 90.0:
+        return min_lat, max_lat, -180.0, 180.0
+    lng_delta = math.degrees(radius_km / (EARTH_RADIUS_KM * math.cos(math.radians(widest))))
+    if lng_delta >= 180.0:
+        return min_lat, max_lat, -180.0, 180.0
+    return min_lat, max_lat, longitude - lng_delta, longitude + lng_delta
+
+
+def bounding_box_filter(latitude, longitude, radius_km):
+    """lookup kwargs selecting the posts inside the bounding box of the circle"""
+    min_lat, max_lat, min_lng, max_lng = bounding_box(latitude, longitude, radius_km)
+    lookups = {'latitude__range': (min_lat, max_lat)}
+    # near the antimeridian the box wraps around, only filter on latitude there
+    if min_lng >= -180.0 and max_lng <= 180.0:
+        lookups['longitude__range'] = (min_lng, max_lng)
+    return lookups
+
+
+def distance_km(latitude, longitude):
+    """great-circle distance (km) between the given point and a post's coordinates"""
+    cosine = (
+        Cos(Radians(latitude)) * Cos(Radians(F('latitude'))) *
+        Cos(Radians(F('longitude')) - Radians(longitude)) +
+        Sin(Radians(latitude)) * Sin(Radians(F('latitude')))
+    )
+    # rounding can push the cosine slightly above 1 for identical points,
+    # which makes ACOS raise instead of returning 0
+    return EARTH_RADIUS_KM * ACos(Least(Greatest(cosine, -1.0), 1.0))
+
+
+################# geohash
+
+def encode_geohash(latitude, longitude, precision=GEOHASH_PRECISION):
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    geohash = []
+    bits = 0
+    bit_count = 0
+    even = True  # bits alternate between longitude (even) and latitude (odd)
+    while len(geohash) < precision:
+        value, interval = (longitude, lng_range) if even else (latitude, lat_range)
+        middle = (interval[0] + interval[1]) / 2
+        bits <<= 1
+        if value >= middle:
+            bits |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            geohash.append(GEOHASH_ALPHABET[bits])
+            bits = 0
+            bit_count = 0
+    return "".join(geohash)
+
+
+def geohash_cell_size(precision):
+    """returns (lat_degrees, lng_degrees) covered by one cell of the given precision"""
+    total_bits = 5 * precision
+    lng_bits = (total_bits + 1) // 2
+    lat_bits = total_bits // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lng_bits
+
+
+def _steps(start, end, step):
+    """points from start to end (both included) never more than step apart"""
+    points = []
+    value = start
+    while value < end:
+        points.append(value)
+        value += step
+    points.append(end)
+    return points
+
+
+def covering_geohashes(min_lat, max_lat, min_lng, max_lng, max_cells=GEOHASH_MAX_CELLS):
+    """
+    the finest set of geohash cells (at most max_cells) covering the box,
+    every post inside the box has a geohash starting with one of them
+    """
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        lat_size, lng_size = geohash_cell_size(precision)
+        rows = math.ceil((max_lat - min_lat) / lat_size) + 1
+        columns = math.ceil((max_lng - min_lng) / lng_size) + 1
+        if rows * columns <= max_cells:
+            break
+    return sorted({
+        encode_geohash(lat, lng, precision)
+        for lat in _steps(min_lat, max_lat, lat_size)
+        for lng in _steps(min_lng, max_lng, lng_size)
+    })
+
+
+def geohash_filter(latitude, longitude, radius_km):
+    """
+    Q selecting the posts in the geohash cells around the circle (a few index range scans),
+    None when the box wraps around the antimeridian
+    """
+    min_lat, max_lat, min_lng, max_lng = bounding_box(latitude, longitude, radius_km)
+    if min_lng < -180.0 or max_lng > 180.0 or (min_lng, max_lng) == (-180.0, 180.0):
+        return None
+    query = Q()
+    for cell in covering_geohashes(min_lat, max_lat, min_lng, max_lng):
+        query |= Q(geohash__startswith=cell)
+    return query
@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+
+"""
+    hashers listed in PASSWORD_HASHERS (built from PASSWORD_HASHER_PROFILE in settings)
+    the first hasher of PASSWORD_HASHERS hashes new passwords, the others only verify
+    existing hashes; user.check_password() re-hashes a password with the preferred
+    hasher (and cost) on the next successful login, so switching profile is transparent
+"""
+
+
+class ConfigurablePBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """PBKDF2-SHA256 with settings.PBKDF2_ITERATIONS iterations"""
+
+    @property
+    def iterations(self):
+        return getattr(settings, 'PBKDF2_ITERATIONS', PBKDF2PasswordHasher.iterations)
+
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+
+from api.geo import encode_geohash
+from api.models import Post
+
+
+class Command(BaseCommand):
+    help = "Fill Post.geohash for existing posts, streaming them by id in batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="recompute the geohash of every post, not only the missing ones",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        posts = Post.objects.filter(latitude__isnull=False, longitude__isnull=False)
+        if not options["all"]:
+            posts = posts.filter(geohash__isnull=True)
+        posts = posts.only("id", "latitude", "longitude").order_by("id")
+
+        updated = 0
+        last_id = 0
+        while True:
+            # keyset batches keep every query small, no long running cursor
+            batch = list(posts.filter(id__gt=last_id)[:batch_size])
+            if not batch:
+                break
+            for post in batch:
+                post.geohash = encode_geohash(post.latitude, post.longitude)
+            Post.objects.bulk_update(batch, ["geohash"])
+            updated += len(batch)
+            last_id = batch[-1].id
+            self.stdout.write(f"{updated} posts updated")
+
+        self.stdout.write(self.style.SUCCESS(f"Done, {updated} posts updated"))
@@ -0,0 +1,290 @@
+import json
+import time
+from contextlib import nullcontext
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, reverse
+from rest_framework.test import APIClient
+
+from api import urls
+from api.authentication import UserRefreshToken
+from api.models import CustomUser, PasswordResetOTP, Post
+
+DEFAULT_BASELINE = Path(settings.BASE_DIR) / "benchmarks" / "baseline.json"
+# password of the users created by generate_dataset
+DATASET_PASSWORD = "Password123"
+RESET_CODE = "123456"
+
+
+class Context:
+    """the ids the scenarios are run with , picked from the seeded database"""
+
+    def __init__(self):
+        # a user with listings of their own and saved listings
+        self.viewer = (
+            CustomUser.objects.filter(post__isnull=False, savedposts__isnull=False)
+            .order_by("id").first()
+        )
+        if self.viewer is None:
+            raise CommandError("the database has no data to benchmark , run generate_dataset first")
+        self.own_listing_id = Post.objects.filter(owner=self.viewer).order_by("id").values_list("id", flat=True)[0]
+        other = Post.objects.filter(active=True).exclude(owner=self.viewer).order_by("id").first()
+        self.listing_id = other.id
+        self.owner_id = other.owner_id
+        self.refresh = str(UserRefreshToken.for_user(self.viewer))
+
+
+def staff_user(ctx):
+    """setup of the staff only endpoints , returns the user the request is sent as"""
+    return CustomUser.objects.create(
+        email="staff@benchmark.findar.local", username="benchmark staff", account_type="individual", is_staff=True,
+    )
+
+
+def reset_code(ctx):
+    """setup of the reset code checks , a pending code for the viewer"""
+    otp = PasswordResetOTP(user=ctx.viewer)
+    otp.set_code(RESET_CODE)
+    otp.save()
+
+
+def scenarios(ctx):
+    """
+    (name , url name , method , options) of every request of the traffic mix,
+        - kwargs / params / data : url kwargs , query string , body
+        - write       : changes data , run last and always rolled back (reads are not , so their
+                        cache entries survive from one request to the next)
+        - iterations  : cap for the slow endpoints (password hashing , the unpaginated search)
+        - anonymous   : sent without the access token
+        - setup       : called before each request (not timed , rolled back with it) ,
+                        may return the user the request is sent as
+        - skip        : reason the route can't be benchmarked locally
+    """
+    listing = {"listing_id": ctx.listing_id}
+    own_listing = {"listing_id": ctx.own_listing_id}
+    algiers = {"latitude": 36.75, "longitude": 3.05}
+    login = {"email": ctx.viewer.email, "password": DATASET_PASSWORD}
+    reset = {"email": ctx.viewer.email, "code": RESET_CODE}
+    new_listing = {
+        "title": "Appartement F3 - Alger", "description": "Benchmark listing", "price": 45000,
+        "latitude": 36.75, "longitude": 3.05, "listing_type": "rent", "building_type": "apartment",
+    }
+    return [
+        ("health-check", "health-check", "get", {"anonymous": True}),
+        ("stats", "stats", "get", {"setup": staff_user}),
+        ("sponsored", "sponsored-listings", "get", {}),
+        ("recent", "recent-listings", "get", {}),
+        ("recent_rent", "recent-listings", "get", {"params": {"listing_type": "rent"}}),
+        ("recent_keyword", "recent-listings", "get", {"params": {"q": "appartement alger"}}),
+        ("recent_typo", "recent-listings", "get", {"params": {"q": "apartemnt"}}),
+        # the legacy response without page_size carries every matching post
+        ("search", "advanced-search", "get", {"iterations": 3}),
+        ("search_paginated", "advanced-search", "get", {"params": {"page_size": 20}}),
+        ("search_filters", "advanced-search", "get", {"params": {
+            "min_price": 20000, "max_price": 80000, "listing_type": "rent", "num_bedrooms": 2,
+            "sort_by": "price_asc", "page_size": 20,
+        }}),
+        ("search_nearby", "advanced-search", "get", {"params": {**algiers, "sort_by": "distance", "page_size": 20}}),
+        ("listing_details", "listing-details", "get", {"kwargs": listing}),
+        ("get_listing", "get-listing", "get", {"kwargs": listing}),
+        ("saved", "saved-listings", "get", {}),
+        ("saved_ids", "saved-listing-ids", "get", {}),
+        ("my_listings", "listings", "get", {}),
+        ("my_listings_paginated", "listings", "get", {"params": {"page_size": 20}}),
+        ("profile", "update_profile", "get", {}),
+        ("user_profile", "get_user_profile", "get", {"kwargs": {"user_id": ctx.owner_id}}),
+        ("user_listings", "user-listings", "get", {"kwargs": {"user_id": ctx.owner_id}}),
+        ("me", "me", "post", {}),
+        # writes
+        ("login", "login", "post", {"data": login, "anonymous": True, "write": True, "iterations": 5}),
+        ("token", "token_obtain_pair", "post", {"data": login, "anonymous": True, "write": True, "iterations": 5}),
+        ("token_refresh", "token_refresh", "post", {"data": {"refresh": ctx.refresh}, "anonymous": True, "write": True}),
+        ("register", "register", "post", {"write": True, "anonymous": True, "iterations": 5, "data": {
+            "email": "benchmark@findar.local", "username": "benchmark", "password": "Benchmark123",
+            "phone": "0555000000", "account_type": "individual",
+        }}),
+        ("logout", "logout", "post", {"skip": "token_blacklist is not in INSTALLED_APPS , it always answers 400"}),
+        ("oauth", "oauth", "post", {"skip": "needs a Firebase ID token"}),
+        ("reset_request", "password-reset-request", "post", {"data": {"email": ctx.viewer.email}, "anonymous": True, "write": True}),
+        ("reset_verify", "password-reset-verify", "post", {
+            "data": reset, "setup": reset_code, "anonymous": True, "write": True,
+        }),
+        ("reset_confirm", "password-reset-confirm", "post", {
+            "data": {**reset, "new_password": "Benchmark123"}, "setup": reset_code, "anonymous": True, "write": True,
+            "iterations": 5,
+        }),
+        ("register_device", "register-device", "post", {"data": {"token": "benchmark-device"}, "write": True}),
+        ("create_listing", "create-listing", "post", {"data": new_listing, "write": True}),
+        ("edit_listing", "edit-listing", "put", {"kwargs": own_listing, "data": {"price": 50000}, "write": True}),
+        ("toggle_listing", "toggle_active_listing", "post", {"kwargs": own_listing, "write": True}),
+        ("boost_listing", "boost_listing", "post", {"kwargs": own_listing, "write": True, "data": {
+            "card_number": "4242424242424242", "card_holder": "Benchmark", "expiry_date": "12/30", "cvv": "123",
+        }}),
+        ("save_listing", "save_listing", "get", {"kwargs": listing, "write": True}),
+        ("bulk_save", "bulk-save-listings", "post", {"data": {"save": [ctx.listing_id]}, "write": True}),
+        ("update_profile", "update_profile", "put", {"data": {"name": "Benchmark"}, "write": True}),
+        ("report_property", "report-property", "post", {
+            "skip": "the view writes Report fields that don't exist (user_id , reason) , it always answers 500",
+        }),
+    ]
+
+
+def percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, max(0, round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark every route of api/urls.py through the test client against the current (seeded) database: "
+        "p50/p95/p99 latency , SQL queries and response bytes per endpoint, compared with a JSON baseline. "
+        "Seed first with `generate_dataset`; writes (and scenario setups) are rolled back"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=30, help="timed requests per scenario")
+        parser.add_argument("--warmup", type=int, default=2, help="untimed requests per scenario")
+        parser.add_argument("--only", nargs="*", help="only run these scenarios")
+        parser.add_argument("--cold", action="store_true", help="clear the cache before every request")
+        parser.add_argument("--baseline", default=str(DEFAULT_BASELINE), help="baseline JSON file")
+        parser.add_argument("--save-baseline", action="store_true", help="write the results as the new baseline")
+        parser.add_argument(
+            "--threshold",
+            type=float,
+            default=0.25,
+            help="fail when a p95 is this much slower than the baseline (0.25 = 25%%) or runs more queries",
+        )
+        parser.add_argument(
+            "--min-delta", type=float, default=2.0, help="ignore p95 changes smaller than this many ms (timer noise)",
+        )
+        parser.add_argument("--output", help="also write the results to this JSON file")
+
+    def handle(self, *args, **options):
+        ctx = Context()
+        client = APIClient()
+        access = str(UserRefreshToken.for_user(ctx.viewer).access_token)
+        plan = scenarios(ctx)
+        self.check_coverage(plan)
+
+        if options["only"]:
+            plan = [scenario for scenario in plan if scenario[0] in options["only"]]
+        # reads first , the writes invalidate caches
+        plan.sort(key=lambda scenario: bool(scenario[3].get("write")))
+
+        results = {}
+        self.stdout.write(f"{'scenario':<24}{'status':>7}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'queries':>9}{'bytes':>9}")
+        for name, url_name, method, spec in plan:
+            if "skip" in spec:
+                self.stdout.write(f"{name:<24}  skipped , {spec['skip']}")
+                continue
+            url = reverse(url_name, kwargs=spec.get("kwargs"))
+            iterations = min(options["iterations"], spec.get("iterations", options["iterations"]))
+
+            timings, queries, statuses = [], [], []
+            for i in range(options["warmup"] + iterations):
+                if options["cold"]:
+                    cache.clear()
+                response, elapsed, query_count = self.request(client, method, url, spec, ctx, access)
+                if i >= options["warmup"]:
+                    timings.append(elapsed)
+                    queries.append(query_count)
+                    statuses.append(response.status_code)
+
+            timings.sort()
+            results[name] = {
+                # the worst status , a scenario failing once in a while is caught too
+                "status": max(statuses),
+                "p50_ms": round(percentile(timings, 0.50), 3),
+                "p95_ms": round(percentile(timings, 0.95), 3),
+                "p99_ms": round(percentile(timings, 0.99), 3),
+                "queries": max(queries),
+                "bytes": len(response.content),
+            }
+            result = results[name]
+            self.stdout.write(
+                f"{name:<24}{result['status']:>7}{result['p50_ms']:>9.2f}{result['p95_ms']:>9.2f}"
+                f"{result['p99_ms']:>9.2f}{result['queries']:>9}{result['bytes']:>9}"
+            )
+
+        report = {
+            "posts": Post.objects.count(),
+            "users": CustomUser.objects.count(),
+            "iterations": options["iterations"],
+            "cold": options["cold"],
+            "endpoints": results,
+        }
+        if options["output"]:
+            Path(options["output"]).write_text(json.dumps(report, indent=2))
+
+        baseline_path = Path(options["baseline"])
+        if options["save_baseline"]:
+            failed = [f"{name} ({result['status']})" for name, result in results.items() if result["status"] >= 400]
+            if failed:
+                # a fast error would become the reference every later run is compared with
+                raise CommandError(f"not saving a baseline with failed requests: {', '.join(failed)}")
+            baseline_path.parent.mkdir(parents=True, exist_ok=True)
+            baseline_path.write_text(json.dumps(report, indent=2) + "\n")
+            self.stdout.write(self.style.SUCCESS(f"baseline written to {baseline_path}"))
+        elif baseline_path.exists():
+            self.compare(
+                json.loads(baseline_path.read_text())["endpoints"], results, options["threshold"], options["min_delta"],
+            )
+
+    def request(self, client, method, url, spec, ctx, access):
+        """
+        sends one request , the changes a write and a setup make are rolled back,
+        reads run outside a transaction so what they cache (database cache included) is kept
+        """
+        rollback = spec.get("write") or "setup" in spec
+        with transaction.atomic() if rollback else nullcontext():
+            user = spec["setup"](ctx) if "setup" in spec else None
+            if user is not None:
+                access = str(UserRefreshToken.for_user(user).access_token)
+            if spec.get("anonymous"):
+                client.credentials()
+            else:
+                client.credentials(HTTP_AUTHORIZATION=f"Bearer {access}")
+            with CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                if method == "get":
+                    response = client.get(url, spec.get("params"))
+                else:
+                    response = getattr(client, method)(url, spec.get("data"), format="json")
+                elapsed = (time.perf_counter() - start) * 1000
+            if rollback:
+                transaction.set_rollback(True)
+        return response, elapsed, len(captured.captured_queries)
+
+    def check_coverage(self, plan):
+        covered = {url_name for _, url_name, _, _ in plan}
+        missing = sorted({
+            pattern.name or str(pattern.pattern)
+            for pattern in urls.urlpatterns
+            if isinstance(pattern, URLPattern) and pattern.name not in covered
+        })
+        if missing:
+            self.stdout.write(self.style.WARNING(f"routes without a scenario: {', '.join(missing)}"))
+
+    def compare(self, baseline, results, threshold, min_delta):
+        regressions = []
+        for name, result in results.items():
+            before = baseline.get(name)
+            if before is None:
+                continue
+            # a request that starts failing usually looks faster , never compare its timings
+            if result["status"] != before["status"]:
+                regressions.append(f"{name}: status {before['status']} -> {result['status']}")
+                continue
+            slower = result["p95_ms"] - before["p95_ms"]
+            if slower > before["p95_ms"] * threshold and slower > min_delta:
+                regressions.append(f"{name}: p95 {before['p95_ms']:.2f} -> {result['p95_ms']:.2f} ms")
+            if result["queries"] > before["queries"]:
+                regressions.append(f"{name}: {before['queries']} -> {result['queries']} queries")
+        if regressions:
+            raise CommandError("regressions against the baseline:\n  " + "\n  ".join(regressions))
+        self.stdout.write(self.style.SUCCESS(f"no regression against the baseline (threshold {threshold:.0%})"))
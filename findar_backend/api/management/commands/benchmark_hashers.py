@@ -0,0 +1,87 @@
+import statistics
+import time
+
+from django.contrib.auth import authenticate
+from django.contrib.auth.hashers import (
+    Argon2PasswordHasher, BCryptSHA256PasswordHasher, PBKDF2PasswordHasher, ScryptPasswordHasher,
+    get_hasher,
+)
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.models import CustomUser
+
+PASSWORD = "Benchmark-Password-123"
+
+
+def pbkdf2_hasher(iterations):
+    return type("PBKDF2Hasher", (PBKDF2PasswordHasher,), {"iterations": iterations})()
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure the password check latency of each hasher (the cost of a login) "
+        "and the logins per second a single core can serve"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rounds", type=int, default=10, help="password checks per hasher")
+        parser.add_argument(
+            "--pbkdf2-iterations",
+            default="100000,300000,600000,1000000",
+            help="comma separated PBKDF2 iteration counts to compare",
+        )
+        parser.add_argument(
+            "--authenticate",
+            action="store_true",
+            help="also time authenticate() end to end with the configured hashers (user query included)",
+        )
+
+    def handle(self, *args, **options):
+        rounds = options["rounds"]
+        candidates = [
+            (f"pbkdf2_sha256 ({int(iterations):,} iterations)", pbkdf2_hasher(int(iterations)))
+            for iterations in options["pbkdf2_iterations"].split(",")
+        ]
+        candidates += [
+            ("argon2", Argon2PasswordHasher()),
+            ("bcrypt_sha256", BCryptSHA256PasswordHasher()),
+            ("scrypt", ScryptPasswordHasher()),
+        ]
+
+        self.stdout.write(f"{'hasher':<40}{'p50 ms':>10}{'max ms':>10}{'logins/s/core':>16}")
+        for name, hasher in candidates:
+            try:
+                if hasher.library:
+                    hasher._load_library()
+            except ValueError:
+                self.stdout.write(f"{name:<40}{'skipped, library not installed':>36}")
+                continue
+            encoded = hasher.encode(PASSWORD, hasher.salt())
+            self.report(name, [self.time(hasher.verify, PASSWORD, encoded) for _ in range(rounds)])
+
+        if options["authenticate"]:
+            self.benchmark_authenticate(rounds)
+
+    def benchmark_authenticate(self, rounds):
+        name = f"authenticate() with {get_hasher().algorithm}"
+        # the benchmark user never outlives the command
+        with transaction.atomic():
+            CustomUser.objects.create_user(
+                email="hasher-benchmark@findar.local", username="hasher-benchmark", password=PASSWORD
+            )
+            timings = [
+                self.time(authenticate, email="hasher-benchmark@findar.local", password=PASSWORD)
+                for _ in range(rounds)
+            ]
+            transaction.set_rollback(True)
+        self.report(name, timings)
+
+    def time(self, function, *args, **kwargs):
+        start = time.perf_counter()
+        function(*args, **kwargs)
+        return (time.perf_counter() - start) * 1000
+
+    def report(self, name, timings):
+        median = statistics.median(timings)
+        self.stdout.write(f"{name:<40}{median:>10.1f}{max(timings):>10.1f}{1000 / median:>16.1f}")
@@ -0,0 +1,127 @@
+import json
+import statistics
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count, F
+from django.db.models.functions import Coalesce
+
+from api.geo import bounding_box_filter, distance_km, geohash_filter
+from api.models import Post, SavedPosts
+from api.pagination import DEFAULT_PAGE_SIZE, keyset_order
+
+# search around Algiers
+SEARCH_POINT = (36.75, 3.05)
+SEARCH_RADIUS_KM = 20
+
+
+def search_ids(posts, sort_key, descending):
+    """the (sort key , id) query advanced_search caches"""
+    return (
+        posts.annotate(sort_key=sort_key)
+        .order_by(*keyset_order(descending))
+        .values_list('sort_key', 'id')[:1001]
+    )
+
+
+def listing_queries(owner_id, user_id):
+    """the query shapes of the listing endpoints , {name: queryset}"""
+    active = Post.objects.cards().filter(active=True)
+    latitude, longitude = SEARCH_POINT
+    nearby = (
+        active.filter(geohash_filter(latitude, longitude, SEARCH_RADIUS_KM))
+        .filter(**bounding_box_filter(latitude, longitude, SEARCH_RADIUS_KM))
+        .annotate(distance=distance_km(latitude, longitude))
+        .filter(distance__lte=SEARCH_RADIUS_KM)
+    )
+    return {
+        'recent': active.order_by('-created_at')[:20],
+        'recent_rent': active.filter(listing_type='rent').order_by('-created_at')[:20],
+        'sponsored': Post.objects.cards().filter(boosted=True, active=True),
+        'search_newest': search_ids(active, F('created_at'), True),
+        'search_price_range': search_ids(active.filter(price__gte=10000, price__lte=50000), F('price'), False),
+        'search_villas_by_area': search_ids(active.filter(building_type='villa'), Coalesce(F('area'), 0.0), True),
+        'search_nearby': search_ids(nearby, F('distance'), False),
+        'my_listings': Post.objects.listings().filter(owner_id=owner_id).order_by('-created_at', '-id'),
+        'profile_listings': (
+            Post.objects.cards().filter(owner_id=owner_id, active=True)
+            .order_by('-created_at', '-id')[:DEFAULT_PAGE_SIZE + 1]
+        ),
+        'saved_listings': (
+            Post.objects.cards().filter(savedposts__user=user_id, active=True)
+            .order_by('-savedposts__saved_at')
+        ),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Record the EXPLAIN ANALYZE plans and timings of the listing queries. "
+        "Run it once before and once after a schema change (e.g. `migrate api 0011` then `migrate`) "
+        "and compare the two outputs with --compare"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--seed-posts", type=int, default=0, help="first add this many synthetic posts (generate_dataset)"
+        )
+        parser.add_argument("--seed", type=int, default=42, help="random seed of the synthetic data")
+        parser.add_argument("--repeat", type=int, default=5, help="timed runs per query")
+        parser.add_argument("--output", help="write the plans and timings to this JSON file")
+        parser.add_argument("--compare", help="JSON file of a previous run to compare the timings with")
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError("the plans are only meaningful on PostgreSQL")
+
+        if options["seed_posts"]:
+            call_command(
+                "generate_dataset",
+                posts=options["seed_posts"],
+                users=max(1, options["seed_posts"] // 20),
+                seed=options["seed"],
+                stdout=self.stdout,
+            )
+
+        # the owner with the most posts
+        owner_id = (
+            Post.objects.values("owner_id").annotate(posts=Count("id")).order_by("-posts")
+            .values_list("owner_id", flat=True).first()
+        )
+        user_id = SavedPosts.objects.values_list("user_id", flat=True).first()
+        if owner_id is None:
+            raise CommandError("no posts , use --seed-posts")
+
+        queries = listing_queries(owner_id, user_id)
+        if user_id is None:
+            del queries["saved_listings"]
+
+        results = {}
+        for name, queryset in queries.items():
+            plan = queryset.explain(analyze=True, buffers=True)
+            timings = []
+            for _ in range(options["repeat"]):
+                start = time.perf_counter()
+                list(queryset.all())
+                timings.append((time.perf_counter() - start) * 1000)
+            results[name] = {"median_ms": round(statistics.median(timings), 3), "plan": plan}
+
+        previous = {}
+        if options["compare"]:
+            with open(options["compare"]) as file:
+                previous = json.load(file)["queries"]
+
+        self.stdout.write(f"{'query':<26}{'median ms':>12}{'before ms':>12}{'speedup':>10}")
+        for name, result in results.items():
+            line = f"{name:<26}{result['median_ms']:>12.2f}"
+            if name in previous:
+                before = previous[name]["median_ms"]
+                line += f"{before:>12.2f}{before / max(result['median_ms'], 0.001):>9.1f}x"
+            self.stdout.write(line)
+
+        if options["output"]:
+            with open(options["output"], "w") as file:
+                json.dump({"posts": Post.objects.count(), "queries": results}, file, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"plans written to {options['output']}"))
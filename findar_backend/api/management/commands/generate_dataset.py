@@ -0,0 +1,265 @@
+import random
+from array import array
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from api.geo import encode_geohash
+from api.models import Boosting, BoostingPlan, CustomUser, DeviceToken, Post, SavedPosts
+
+# (name , latitude , longitude , weight) , the posts are spread around the big cities
+CITIES = [
+    ("Alger", 36.753, 3.058, 30),
+    ("Oran", 35.697, -0.633, 14),
+    ("Constantine", 36.365, 6.615, 9),
+    ("Annaba", 36.900, 7.766, 6),
+    ("Blida", 36.470, 2.829, 6),
+    ("Sétif", 36.191, 5.414, 6),
+    ("Béjaïa", 36.751, 5.064, 5),
+    ("Tizi Ouzou", 36.712, 4.046, 5),
+    ("Batna", 35.556, 6.174, 4),
+    ("Tlemcen", 34.878, -1.315, 4),
+    ("Biskra", 34.850, 5.728, 3),
+    ("Ghardaïa", 32.491, 3.673, 2),
+    ("Ouargla", 31.950, 5.325, 2),
+    ("Tamanrasset", 22.785, 5.523, 1),
+]
+DISTRICTS = ["Centre-ville", "Cité 500 logements", "Hai El Badr", "Bab El Oued", "Les Oliviers", "El Bahia", "Nouvelle ville"]
+
+# building type -> (weight , rooms range , area range m² , sale price range DZD)
+BUILDINGS = {
+    "apartment": (50, (1, 5), (45, 160), (4_000_000, 35_000_000)),
+    "house": (15, (3, 8), (120, 400), (12_000_000, 90_000_000)),
+    "studio": (15, (1, 1), (20, 45), (2_500_000, 8_000_000)),
+    "villa": (10, (4, 10), (250, 900), (30_000_000, 250_000_000)),
+    "office": (10, (0, 0), (30, 300), (6_000_000, 60_000_000)),
+}
+BUILDING_LABELS = {"apartment": "Appartement", "house": "Maison", "studio": "Studio", "villa": "Villa", "office": "Bureau"}
+MONTHLY_RENT_RATIO = 0.004  # monthly rent ~ 0.4% of the sale price
+
+
+@contextmanager
+def explicit_timestamps(*fields):
+    """lets bulk_create keep the generated dates of auto_now fields"""
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field, _, _ in saved:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate a large synthetic dataset (users , posts around Algerian cities , saved posts , "
+        "boostings , device tokens) with bulk inserts in batches , deterministic for a given --seed"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=10_000)
+        parser.add_argument("--posts", type=int, default=100_000)
+        parser.add_argument("--saves-per-user", type=float, default=5.0, help="average saved posts per user")
+        parser.add_argument("--boosted", type=float, default=0.02, help="share of the posts that are boosted")
+        parser.add_argument("--devices", type=float, default=0.7, help="share of the users with a device token")
+        parser.add_argument("--agencies", type=float, default=0.15, help="share of the users that are agencies")
+        parser.add_argument("--days", type=int, default=365, help="the posts are spread over this many days")
+        parser.add_argument("--batch-size", type=int, default=5_000)
+        parser.add_argument("--seed", type=int, default=42)
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options["seed"])
+        self.seed = options["seed"]
+        self.batch_size = options["batch_size"]
+        self.now = timezone.now()
+        self.namespace = self.email_namespace()
+
+        # all or nothing , a failed run leaves no partial batches behind
+        with transaction.atomic(), explicit_timestamps(
+            Post._meta.get_field("created_at"),
+            SavedPosts._meta.get_field("saved_at"),
+            Boosting._meta.get_field("created_at"),
+        ):
+            user_ids, agency_ids = self.create_users(options["users"], options["agencies"])
+            post_ids, post_owners, boosted_ids = self.create_posts(
+                options["posts"], user_ids, agency_ids, options["boosted"], options["days"],
+            )
+            self.create_saved_posts(user_ids, post_ids, post_owners, options["saves_per_user"])
+            self.create_boostings(boosted_ids)
+            self.create_devices(user_ids, options["devices"])
+
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                for model in (CustomUser, Post, SavedPosts, Boosting, DeviceToken):
+                    cursor.execute(f"ANALYZE {model._meta.db_table}")
+        self.stdout.write(self.style.SUCCESS("Done"))
+
+    def email_namespace(self):
+        """
+        s{seed} for the first run of a seed , s{seed}.r{n} for the n-th rerun
+        (the emails are unique , rerunning with the same seed adds another dataset)
+        """
+        runs = CustomUser.objects.filter(
+            email__regex=rf"^user0\.s{self.seed}(\.r[0-9]+)?@dataset\.findar\.local$"
+        ).count()
+        return f"s{self.seed}" if not runs else f"s{self.seed}.r{runs}"
+
+    def insert(self, model, rows, label, **kwargs):
+        """bulk inserts the rows generator in batches , returns the created ids"""
+        ids = array("q")
+        batch = []
+        total = 0
+
+        def flush():
+            nonlocal total
+            created = model.objects.bulk_create(batch, **kwargs)
+            ids.extend(obj.pk for obj in created if obj.pk is not None)
+            total += len(batch)
+            batch.clear()
+            self.stdout.write(f"\r{label}: {total}", ending="")
+
+        for row in rows:
+            batch.append(row)
+            if len(batch) == self.batch_size:
+                flush()
+        if batch:
+            flush()
+        self.stdout.write("")
+        return ids
+
+    def create_users(self, count, agencies):
+        rng = self.rng
+        # hashing a password per user would take hours , every user shares the same one
+        password = make_password("Password123")
+        is_agency = [rng.random() < agencies for _ in range(count)]
+
+        def rows():
+            for i in range(count):
+                yield CustomUser(
+                    email=f"user{i}.{self.namespace}@dataset.findar.local",
+                    username=f"{'Agence' if is_agency[i] else 'User'} {i}",
+                    phone=f"0{rng.choice('567')}{rng.randrange(10 ** 8):08d}",
+                    account_type="agency" if is_agency[i] else "individual",
+                    password=password,
+                    last_active=self.now - timedelta(seconds=rng.randrange(60 * 24 * 3600)),
+                    credits=rng.randrange(100),
+                )
+
+        user_ids = self.insert(CustomUser, rows(), "users")
+        agency_ids = array("q", (user_id for user_id, agency in zip(user_ids, is_agency) if agency))
+        return user_ids, agency_ids
+
+    def create_posts(self, count, user_ids, agency_ids, boosted_share, days):
+        rng = self.rng
+        city_weights = [city[3] for city in CITIES]
+        building_types = list(BUILDINGS)
+        building_weights = [BUILDINGS[name][0] for name in building_types]
+        owners = array("q")
+        boosted_ids = array("q")
+        boosted_flags = array("b")
+
+        def rows():
+            for i in range(count):
+                # agencies publish most of the listings
+                if agency_ids and rng.random() < 0.7:
+                    owner_id = rng.choice(agency_ids)
+                else:
+                    owner_id = rng.choice(user_ids)
+                owners.append(owner_id)
+
+                city, city_lat, city_lng, _ = rng.choices(CITIES, city_weights)[0]
+                latitude = city_lat + rng.gauss(0, 0.05)
+                longitude = city_lng + rng.gauss(0, 0.05)
+                building_type = rng.choices(building_types, building_weights)[0]
+                _, rooms, area_range, price_range = BUILDINGS[building_type]
+                bedrooms = rng.randint(*rooms)
+                listing_type = "rent" if rng.random() < 0.45 else "sale"
+                price = rng.uniform(*price_range)
+                if listing_type == "rent":
+                    price *= MONTHLY_RENT_RATIO
+                boosted = rng.random() < boosted_share
+                boosted_flags.append(boosted)
+
+                label = BUILDING_LABELS[building_type]
+                yield Post(
+                    owner_id=owner_id,
+                    title=f"{label} F{bedrooms + 1} {'à louer' if listing_type == 'rent' else 'à vendre'} - {city}",
+                    description=f"{label} de {bedrooms} chambres à {city}, proche de toutes commodités.",
+                    price=round(price, -2),
+                    address=f"{rng.choice(DISTRICTS)}, {city}",
+                    created_at=self.now - timedelta(seconds=rng.randrange(days * 24 * 3600)),
+                    active=rng.random() < 0.9,
+                    boosted=boosted,
+                    main_pic=f"https://picsum.photos/seed/findar{i}/800/600",
+                    latitude=latitude,
+                    longitude=longitude,
+                    geohash=encode_geohash(latitude, longitude),
+                    bedrooms=bedrooms,
+                    bathrooms=max(1, bedrooms // 2),
+                    livingrooms=1 if bedrooms else 0,
+                    area=round(rng.uniform(*area_range), 1),
+                    listing_type=listing_type,
+                    building_type=building_type,
+                )
+
+        post_ids = self.insert(Post, rows(), "posts")
+        boosted_ids.extend(post_id for post_id, boosted in zip(post_ids, boosted_flags) if boosted)
+        return post_ids, owners, boosted_ids
+
+    def create_saved_posts(self, user_ids, post_ids, post_owners, saves_per_user):
+        rng = self.rng
+        if not post_ids:
+            return
+
+        def rows():
+            for user_id in user_ids:
+                for _ in range(int(rng.expovariate(1 / saves_per_user)) if saves_per_user else 0):
+                    index = rng.randrange(len(post_ids))
+                    if post_owners[index] == user_id:
+                        continue
+                    yield SavedPosts(
+                        user_id=user_id,
+                        post_id=post_ids[index],
+                        saved_at=self.now - timedelta(seconds=rng.randrange(90 * 24 * 3600)),
+                    )
+
+        # the same post can be drawn twice for a user
+        self.insert(SavedPosts, rows(), "saved posts", ignore_conflicts=True)
+
+    def create_boostings(self, boosted_ids):
+        rng = self.rng
+        plans = list(BoostingPlan.objects.filter(target_audience__isnull=True))
+        if not plans:
+            # bulk_create skips BoostingPlan.save , no "new plans" notification is queued
+            plans = BoostingPlan.objects.bulk_create([
+                BoostingPlan(plan_type=plan_type, credit_cost=cost, duration=days)
+                for plan_type, cost, days in (("basic", 10, 7), ("premium", 25, 15), ("gold", 50, 30))
+            ])
+
+        def rows():
+            for post_id in boosted_ids:
+                plan = rng.choice(plans)
+                created_at = self.now - timedelta(days=rng.uniform(0, plan.duration))
+                yield Boosting(
+                    boost_plan=plan,
+                    post_id=post_id,
+                    created_at=created_at,
+                    expires_at=created_at + timedelta(days=plan.duration),
+                )
+
+        self.insert(Boosting, rows(), "boostings")
+
+    def create_devices(self, user_ids, share):
+        rng = self.rng
+
+        def rows():
+            for user_id in user_ids:
+                if rng.random() < share:
+                    yield DeviceToken(user_id=user_id, token=f"dataset-s{self.seed}-{user_id}")
+
+        self.insert(DeviceToken, rows(), "device tokens", ignore_conflicts=True)
@@ -0,0 +1,57 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.models import EmailOutbox
+from api.outbox import MAX_ATTEMPTS, RESULT_FIELDS, claim_batch, record_attempt
+from api.services import send_outbox_emails
+
+
+class Command(BaseCommand):
+    help = "Send the pending emails of the outbox in batches over one SMTP connection, retrying failures"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=100)
+        parser.add_argument(
+            "--max-attempts",
+            type=int,
+            default=MAX_ATTEMPTS,
+            help="failed emails are marked dead after this many attempts",
+        )
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="keep polling the outbox instead of exiting once it is drained",
+        )
+        parser.add_argument("--interval", type=float, default=2.0, help="seconds between polls with --loop")
+
+    def handle(self, *args, **options):
+        while True:
+            while self.process_batch(options):
+                pass
+            if not options["loop"]:
+                break
+            time.sleep(options["interval"])
+
+    def process_batch(self, options):
+        """sends one batch , returns the number of emails processed"""
+        batch = claim_batch(EmailOutbox, options["batch_size"])
+        if not batch:
+            return 0
+
+        errors = send_outbox_emails(batch)
+
+        counts = {"sent": 0, "pending": 0, "dead": 0}
+        for email, error in zip(batch, errors):
+            record_attempt(email, error, options["max_attempts"])
+            if email.status != "pending":
+                # the reset code is not kept once delivered or given up on
+                email.body = ""
+            counts[email.status] += 1
+
+        EmailOutbox.objects.bulk_update(batch, RESULT_FIELDS + ["body"])
+
+        self.stdout.write(
+            f"{counts['sent']} sent, {counts['pending']} to retry, {counts['dead']} dead"
+        )
+        return len(batch)
@@ -0,0 +1,67 @@
+import time
+
+from django.core.management.base import BaseCommand
+from firebase_admin.messaging import UnregisteredError
+
+from api.models import NotificationOutbox
+from api.outbox import MAX_ATTEMPTS, RESULT_FIELDS, claim_batch, record_attempt
+from api.services import delete_unregistered_tokens, send_outbox_messages
+
+
+class Command(BaseCommand):
+    help = "Send the pending push notifications of the outbox to FCM in batches, retrying failures"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=4,
+            help="max number of FCM batch requests in flight",
+        )
+        parser.add_argument(
+            "--max-attempts",
+            type=int,
+            default=MAX_ATTEMPTS,
+            help="failed notifications are marked dead after this many attempts",
+        )
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="keep polling the outbox instead of exiting once it is drained",
+        )
+        parser.add_argument("--interval", type=float, default=5.0, help="seconds between polls with --loop")
+
+    def handle(self, *args, **options):
+        while True:
+            while self.process_batch(options):
+                pass
+            if not options["loop"]:
+                break
+            time.sleep(options["interval"])
+
+    def process_batch(self, options):
+        """sends one batch , returns the number of notifications processed"""
+        batch = claim_batch(NotificationOutbox, options["batch_size"])
+        if not batch:
+            return 0
+
+        errors = send_outbox_messages(batch, workers=options["workers"])
+
+        unregistered = []
+        counts = {"sent": 0, "pending": 0, "dead": 0}
+        for notification, error in zip(batch, errors):
+            # the device is gone , retrying can't succeed
+            gone = isinstance(error, UnregisteredError)
+            if gone:
+                unregistered.append(notification.target)
+            record_attempt(notification, error, options["max_attempts"], permanent=gone)
+            counts[notification.status] += 1
+
+        NotificationOutbox.objects.bulk_update(batch, RESULT_FIELDS)
+        delete_unregistered_tokens(unregistered)
+
+        self.stdout.write(
+            f"{counts['sent']} sent, {counts['pending']} to retry, {counts['dead']} dead"
+        )
+        return len(batch)
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.8 on 2026-10-18 13:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="post",
+            index=models.Index(
+                fields=["latitude", "longitude"], name="post_lat_lng_idx"
+            ),
+        ),
+    ]
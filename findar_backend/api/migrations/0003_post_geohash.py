@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 13:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0002_post_lat_lng_idx"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="post",
+            name="geohash",
+            field=models.CharField(blank=True, db_index=True, max_length=12, null=True),
+        ),
+    ]
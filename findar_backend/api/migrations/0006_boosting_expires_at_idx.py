@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 13:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0005_post_version"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="boosting",
+            name="expires_at",
+            field=models.DateTimeField(db_index=True),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.8 on 2026-10-18 13:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0008_email_outbox"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="passwordresetotp",
+            index=models.Index(
+                fields=["user", "used", "created_at"], name="otp_user_used_created_idx"
+            ),
+        ),
+    ]
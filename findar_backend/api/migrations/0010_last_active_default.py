@@ -0,0 +1,19 @@
+# Generated by Django 5.2.8 on 2026-10-18 13:51
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0009_password_reset_otp_idx"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="customuser",
+            name="last_active",
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.8 on 2026-10-18 13:51
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0010_last_active_default"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="customuser",
+            name="last_engagement_reminder_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name="customuser",
+            name="last_active",
+            field=models.DateTimeField(
+                db_index=True, default=django.utils.timezone.now
+            ),
+        ),
+    ]
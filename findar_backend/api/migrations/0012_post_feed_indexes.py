@@ -0,0 +1,73 @@
+# Generated by Django 5.2.8 on 2026-10-18 13:55
+
+import django.db.models.functions.comparison
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # the indexes are built without locking the posts table against writes
+    atomic = False
+
+    dependencies = [
+        ("api", "0011_engagement_reminder_tracking"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="post",
+            index=models.Index(
+                condition=models.Q(("active", True)),
+                fields=["created_at", "id"],
+                name="post_active_created_idx",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="post",
+            index=models.Index(
+                condition=models.Q(("active", True)),
+                fields=["listing_type", "created_at", "id"],
+                name="post_active_type_created_idx",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="post",
+            index=models.Index(
+                condition=models.Q(("active", True)),
+                fields=["building_type", "created_at", "id"],
+                name="post_active_building_idx",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="post",
+            index=models.Index(
+                condition=models.Q(("active", True)),
+                fields=["price", "id"],
+                name="post_active_price_idx",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="post",
+            index=models.Index(
+                django.db.models.functions.comparison.Coalesce("area", 0.0),
+                models.F("id"),
+                condition=models.Q(("active", True)),
+                name="post_active_area_idx",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="post",
+            index=models.Index(
+                condition=models.Q(("active", True), ("boosted", True)),
+                fields=["created_at"],
+                name="post_sponsored_idx",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="post",
+            index=models.Index(
+                fields=["owner", "active", "created_at", "id"],
+                name="post_owner_active_created_idx",
+            ),
+        ),
+    ]
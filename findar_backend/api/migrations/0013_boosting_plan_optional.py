@@ -0,0 +1,24 @@
+# Generated by Django 5.2.8 on 2026-10-18 14:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0012_post_feed_indexes"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="boosting",
+            name="boost_plan",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                to="api.boostingplan",
+            ),
+        ),
+    ]
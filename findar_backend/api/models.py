@@ -1,10 +1,21 @@
+import hashlib
+import hmac
+
+from django.conf import settings
+from django.contrib.auth.hashers import check_password
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
+from django.db import models, transaction
+from django.db.models.functions import Coalesce
 from datetime import timedelta
 from django.utils import timezone
 from .services import new_agency_boosting_plans_notification, new_individual_boosting_plans_notification
+from .geo import encode_geohash
+from .cache import listing_changed
 
 OTP_EXPIRATION_MINUTES = 10
+OTP_MAX_ATTEMPTS = 5
 
 # Create your models here.
 
@@ -34,9 +45,17 @@ class CustomUser(AbstractUser):
     account_type    = models.CharField(max_length=20, choices=ACCOUNT_CHOICES)
     USERNAME_FIELD = "email"
     REQUIRED_FIELDS = ["username"]
-    last_active = models.DateTimeField(auto_now=True)
+    last_active = models.DateTimeField(default=timezone.now, db_index=True)  # updated by cache.touch_last_active
+    last_engagement_reminder_at = models.DateTimeField(null=True, blank=True)
     credits = models.IntegerField(default=0)
     
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        from .authentication import forget_cached_user
+        from .cache import invalidate_profile_header
+        forget_cached_user(self.id)
+        invalidate_profile_header(self.id)
+
     def __str__(self):
         print(f"DEBUG - User ID: {self.id}, Username: {self.username}")
         return self.username
@@ -57,6 +76,35 @@ BUILDING_TYPE_CHOICES = [
     ('office'    , 'Office'),
 ]
 
+# owner columns read by PostSerializers.get_owner_details
+OWNER_DETAIL_FIELDS = ('id', 'username', 'email', 'phone', 'profile_pic', 'account_type')
+
+# columns rendered by the listing cards of the home / search / saved / profile screens
+POST_CARD_FIELDS = (
+    'id', 'title', 'price', 'main_pic', 'listing_type', 'building_type',
+    'bedrooms', 'bathrooms', 'area', 'address', 'boosted',
+)
+
+class PostQuerySet(models.QuerySet):
+
+    def listings(self):
+        """
+        posts ready to be serialized by PostSerializers :
+        the owner is joined in the same query (no query per post for owner_details)
+        and the columns nobody reads (search vector , owner password ...) are left out
+        """
+        post_fields = [
+            field.name for field in Post._meta.concrete_fields
+            if field.name != 'search_vector'
+        ]
+        owner_fields = [f"owner__{name}" for name in OWNER_DETAIL_FIELDS]
+        return self.select_related('owner').only(*post_fields, *owner_fields)
+
+    def cards(self):
+        """posts ready to be serialized by PostCardSerializers , only the card columns are read"""
+        return self.only(*POST_CARD_FIELDS)
+
+
 class Post(models.Model):
 
     owner        = models.ForeignKey(CustomUser , on_delete=models.CASCADE)
@@ -77,6 +125,96 @@ class Post(models.Model):
     area         = models.FloatField(default=0.0  , null=True)
     listing_type  = models.CharField(max_length=50 , choices=LISTING_TYPE_CHOICES, null=True)  
     building_type = models.CharField(max_length=50 , choices=BUILDING_TYPE_CHOICES, null=True)  
+    # derived from latitude/longitude on save, nearby searches filter on its prefixes
+    geohash       = models.CharField(max_length=12 , null=True , blank=True , db_index=True)
+    # bumped on every change , the detail endpoints derive their ETag from it
+    version       = models.PositiveIntegerField(default=1)
+    # maintained by postgres, the title weighs more than the description in the ranking
+    search_vector = models.GeneratedField(
+        expression=(
+            SearchVector('title', weight='A', config='simple') +
+            SearchVector('description', weight='B', config='simple')
+        ),
+        output_field=SearchVectorField(),
+        db_persist=True,
+    )
+
+    objects = PostQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # bounding box prefilter of the location search
+            models.Index(fields=['latitude', 'longitude'], name='post_lat_lng_idx'),
+            # keyword search : full text first , trigram similarity on the title for typos
+            GinIndex(fields=['search_vector'], name='post_search_vector_idx'),
+            GinIndex(fields=['title'], opclasses=['gin_trgm_ops'], name='post_title_trgm_idx'),
+            # every public feed only reads active posts , partial indexes matching the
+            # filter + keyset order (sort key , id) of the home / search screens
+            models.Index(fields=['created_at', 'id'], condition=models.Q(active=True), name='post_active_created_idx'),
+            models.Index(
+                fields=['listing_type', 'created_at', 'id'], condition=models.Q(active=True),
+                name='post_active_type_created_idx',
+            ),
+            models.Index(
+                fields=['building_type', 'created_at', 'id'], condition=models.Q(active=True),
+                name='post_active_building_idx',
+            ),
+            models.Index(fields=['price', 'id'], condition=models.Q(active=True), name='post_active_price_idx'),
+            models.Index(
+                Coalesce('area', 0.0), 'id', condition=models.Q(active=True), name='post_active_area_idx',
+            ),
+            # sponsored feed
+            models.Index(
+                fields=['created_at'], condition=models.Q(active=True, boosted=True), name='post_sponsored_idx',
+            ),
+            # my listings / profile listings , newest first per owner and status
+            models.Index(fields=['owner', 'active', 'created_at', 'id'], name='post_owner_active_created_idx'),
+        ]
+
+    # boosted as loaded from the database , posts created in python were never in the sponsored feed
+    _loaded_boosted = False
+
+    def save(self, *args, **kwargs):
+        if self.latitude is not None and self.longitude is not None:
+            self.geohash = encode_geohash(self.latitude, self.longitude)
+        else:
+            self.geohash = None
+
+        adding = self._state.adding
+        if not adding:
+            # incremented by the database , two concurrent edits never share a version (an ETag)
+            self.version = models.F('version') + 1
+
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            update_fields = {*update_fields, 'version'}
+            if {'latitude', 'longitude'} & update_fields:
+                update_fields.add('geohash')
+            kwargs['update_fields'] = update_fields
+        super().save(*args, **kwargs)
+        if not adding:
+            self.refresh_from_db(fields=['version'])
+
+        # after the commit , a concurrent request could otherwise cache the old row again
+        post_id, owner_id, boosted = self.id, self.owner_id, self.boosted or self._loaded_boosted
+        transaction.on_commit(lambda: listing_changed(post_id, owner_id, boosted))
+        self._loaded_boosted = self.boosted
+
+    def delete(self, *args, **kwargs):
+        # delete() resets the pk , read what listing_changed needs first
+        post_id, owner_id, boosted = self.pk, self.owner_id, self.boosted or self._loaded_boosted
+        # the saved posts rows go with the post (cascade) , so do the saved ids cached for their users
+        saved_by = list(SavedPosts.objects.filter(post_id=post_id).values_list('user_id', flat=True))
+        result = super().delete(*args, **kwargs)
+        transaction.on_commit(lambda: listing_changed(post_id, owner_id, boosted, saved_by))
+        return result
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        post = super().from_db(db, field_names, values)
+        # un-boosting must clear the sponsored feed too , a deferred value may have been boosted
+        post._loaded_boosted = post.__dict__.get('boosted', True)
+        return post
 
     def __str__(self):
         print(f"DEBUG POST - ID: {self.id}, Owner ID: {self.owner.id}, Owner Username: {self.owner.username}, Title: {self.title}")
@@ -129,35 +267,73 @@ class BoostingPlan(models.Model):
     duration            = models.IntegerField() #not sure if in days, hours or seconds
 
     def save(self, *args, **kwargs):
-        
+        super().save(*args, **kwargs)
+        # queued in the outbox , saved (or rolled back) together with the plan
         if self.target_audience == 'agencies':
             new_agency_boosting_plans_notification()
         elif self.target_audience == 'individuals':
             new_individual_boosting_plans_notification()
-        super().save(*args, **kwargs)
     
 ################# Boosting Model
 
 
+BOOST_DAYS_PER_MONTH = 30
+MAX_BOOST_MONTHS = 12
+
 class Boosting(models.Model):
-    boost_plan      = models.ForeignKey(BoostingPlan, on_delete=models.CASCADE)
+    # null for the boosts bought on boost_listing with a plan the app sells but the table lacks
+    boost_plan      = models.ForeignKey(BoostingPlan, on_delete=models.CASCADE, null=True, blank=True)
     post            = models.ForeignKey(Post, on_delete=models.CASCADE)
     created_at      = models.DateTimeField(auto_now=True)
-    expires_at      = models.DateTimeField()
+    expires_at      = models.DateTimeField(db_index=True)
     notified      = models.BooleanField(default=False)
 
 
 ################# Password-reset Model
 
+OTP_HASH_PREFIX = 'hmac-sha256$'
+
 class PasswordResetOTP(models.Model):
+    """
+    the codes are hashed with an HMAC-SHA256 keyed by settings.OTP_HMAC_KEY, a slow
+    password hasher adds nothing for a 6 digit code that expires in minutes and
+    only allows OTP_MAX_ATTEMPTS guesses
+    """
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
     code_hash = models.CharField(max_length=128)
     created_at = models.DateTimeField(auto_now_add=True)
     attempts = models.PositiveSmallIntegerField(default=0)
     used = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            # latest unused code of a user
+            models.Index(fields=['user', 'used', 'created_at'], name='otp_user_used_created_idx'),
+        ]
+
+    def _hmac(self, code):
+        message = f"{self.user_id}:{code}".encode()
+        digest = hmac.new(settings.OTP_HMAC_KEY.encode(), message, hashlib.sha256).hexdigest()
+        return OTP_HASH_PREFIX + digest
+
+    def set_code(self, code):
+        self.code_hash = self._hmac(code)
+
+    def check_code(self, code):
+        if not code:
+            return False
+        if self.code_hash.startswith(OTP_HASH_PREFIX):
+            return hmac.compare_digest(self.code_hash, self._hmac(code))
+        # codes created before the HMAC hashing
+        return check_password(code, self.code_hash)
+
+    def record_failed_attempt(self):
+        # incremented in the database so concurrent guesses are all counted
+        PasswordResetOTP.objects.filter(id=self.id).update(attempts=models.F('attempts') + 1)
+        self.attempts += 1
+
     def is_expired(self):
-        return timezone.now() > self.created_at + timedelta(minutes=10)
+        return timezone.now() > self.created_at + timedelta(minutes=OTP_EXPIRATION_MINUTES)
 
 
 ################### Notification tokens 
@@ -170,4 +346,76 @@ class DeviceToken(models.Model):
     )
     token = models.CharField(max_length=255, unique=True)
     created_at = models.DateTimeField(auto_now_add=True)
-    last_seen = models.DateTimeField(auto_now=True)
\ No newline at end of file
+    last_seen = models.DateTimeField(auto_now=True)
+
+################### Notification outbox
+
+NOTIFICATION_TARGET_CHOICES = [
+    ('topic' , 'Topic'),
+    ('token' , 'Device token')
+]
+NOTIFICATION_STATUS_CHOICES = [
+    ('pending' , 'Pending'),
+    ('sent'    , 'Sent'),
+    ('dead'    , 'Dead')
+]
+
+class NotificationOutbox(models.Model):
+    """
+    push notifications waiting to be sent to FCM by the send_notifications worker,
+    requests only insert rows here so they never wait on Firebase
+    """
+    target_type     = models.CharField(max_length=10, choices=NOTIFICATION_TARGET_CHOICES)
+    target          = models.CharField(max_length=255)  # topic name or device token
+    title           = models.CharField(max_length=255)
+    body            = models.TextField()
+    data            = models.JSONField(default=dict, blank=True)
+    status          = models.CharField(max_length=10, choices=NOTIFICATION_STATUS_CHOICES, default='pending')
+    attempts        = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error      = models.TextField(blank=True)
+    created_at      = models.DateTimeField(auto_now_add=True)
+    sent_at         = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # the worker only scans the pending rows that are due
+            models.Index(
+                fields=['next_attempt_at', 'id'],
+                condition=models.Q(status='pending'),
+                name='notification_outbox_due_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.title} -> {self.target_type} {self.target} ({self.status})"
+
+
+################### Email outbox
+
+class EmailOutbox(models.Model):
+    """
+    emails waiting to be sent by the send_emails worker over one SMTP connection,
+    the body is cleared once sent or dead (it holds the password reset codes)
+    """
+    to              = models.EmailField()
+    subject         = models.CharField(max_length=255)
+    body            = models.TextField()
+    status          = models.CharField(max_length=10, choices=NOTIFICATION_STATUS_CHOICES, default='pending')
+    attempts        = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error      = models.TextField(blank=True)
+    created_at      = models.DateTimeField(auto_now_add=True)
+    sent_at         = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['next_attempt_at', 'id'],
+                condition=models.Q(status='pending'),
+                name='email_outbox_due_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} -> {self.to} ({self.status})"
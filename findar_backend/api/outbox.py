@@ -0,0 +1,59 @@
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+"""
+    shared logic of the database backed queues (NotificationOutbox , EmailOutbox)
+    rows are claimed with skip_locked so several workers can drain a queue,
+    failed rows are retried with an exponential backoff then marked dead
+"""
+
+# a claimed batch is hidden from the other workers for this long,
+# it becomes due again if the worker dies before recording the results
+CLAIM_LEASE = timedelta(minutes=5)
+RETRY_BASE_DELAY = 30  # seconds , doubled after every failed attempt
+RETRY_MAX_DELAY = 60 * 60
+MAX_ATTEMPTS = 5
+
+
+def retry_delay(attempts):
+    return timedelta(seconds=min(RETRY_BASE_DELAY * 2 ** (attempts - 1), RETRY_MAX_DELAY))
+
+
+def claim_batch(model, batch_size):
+    """locks and leases up to batch_size due pending rows of model"""
+    now = timezone.now()
+    with transaction.atomic():
+        batch = list(
+            model.objects
+            .select_for_update(skip_locked=True)
+            .filter(status='pending', next_attempt_at__lte=now)
+            .order_by('next_attempt_at', 'id')[:batch_size]
+        )
+        model.objects.filter(id__in=[row.id for row in batch]).update(
+            next_attempt_at=now + CLAIM_LEASE
+        )
+    return batch
+
+
+def record_attempt(row, error, max_attempts=MAX_ATTEMPTS, permanent=False):
+    """
+    updates the status of a row after a delivery attempt (error is None on success),
+    permanent errors are dead lettered right away
+    """
+    now = timezone.now()
+    row.attempts += 1
+    if error is None:
+        row.status = 'sent'
+        row.sent_at = now
+        row.last_error = ''
+        return
+    row.last_error = repr(error)[:1000]
+    if permanent or row.attempts >= max_attempts:
+        row.status = 'dead'
+    else:
+        row.next_attempt_at = now + retry_delay(row.attempts)
+
+
+RESULT_FIELDS = ['status', 'attempts', 'next_attempt_at', 'last_error', 'sent_at']
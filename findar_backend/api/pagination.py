@@ -0,0 +1,180 @@
+import base64
+import binascii
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import F, Q, Window
+from django.db.models.functions import RowNumber
+
+"""
+    keyset (cursor) pagination helpers
+    a cursor is an opaque base64 string holding the sort key and id of the last
+    row of the previous page, so every page is a bounded index range scan
+    instead of an OFFSET that gets slower the deeper the user scrolls
+"""
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def wants_pagination(request):
+    """the app opts into paginated responses by sending page_size or cursor"""
+    params = request.query_params
+    return 'page_size' in params or 'cursor' in params
+
+
+def get_page_size(request):
+    try:
+        page_size = int(request.query_params.get('page_size', DEFAULT_PAGE_SIZE))
+    except (TypeError, ValueError):
+        page_size = DEFAULT_PAGE_SIZE
+    return max(1, min(page_size, MAX_PAGE_SIZE))
+
+
+def encode_cursor(tag, key, pk):
+    if hasattr(key, 'isoformat'):
+        key = key.isoformat()
+    raw = json.dumps([tag, key, pk], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def sort_key_field(queryset, sort_key):
+    """the field the values of sort_key are typed as , used to convert the key of a cursor"""
+    return queryset.annotate(sort_key=sort_key).query.annotations['sort_key'].output_field
+
+
+def decode_cursor(cursor, tag, key_field):
+    """
+    returns (key, pk) or None when no cursor was sent, raises InvalidCursor
+    the key is converted with key_field so a tampered cursor never reaches the database
+    """
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        cursor_tag, key, pk = json.loads(raw)
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+        raise InvalidCursor(cursor)
+    # a cursor from another sort order (or another list) can not be reused
+    if cursor_tag != tag or not isinstance(pk, int) or key is None:
+        raise InvalidCursor(cursor)
+    try:
+        key = key_field.to_python(key)
+    except (ValidationError, TypeError, ValueError):
+        raise InvalidCursor(cursor)
+    return key, pk
+
+
+def keyset_order(descending):
+    """order by the annotated sort key with the id as a stable tiebreaker"""
+    return ('-sort_key', '-id') if descending else ('sort_key', 'id')
+
+
+def paginate_keyset(queryset, sort_key, descending, cursor, page_size, tag):
+    """
+    returns (page, next_cursor) for a queryset ordered by sort_key then id
+        - sort_key  : expression the rows are ordered by (annotated as sort_key)
+        - tag       : name of the ordering, stored in the cursor so it can't be
+                      replayed against a different ordering
+    """
+    queryset = queryset.annotate(sort_key=sort_key)
+    position = decode_cursor(cursor, tag, queryset.query.annotations['sort_key'].output_field)
+    if position is not None:
+        key, pk = position
+        if descending:
+            queryset = queryset.filter(Q(sort_key__lt=key) | Q(sort_key=key, id__lt=pk))
+        else:
+            queryset = queryset.filter(Q(sort_key__gt=key) | Q(sort_key=key, id__gt=pk))
+
+    # fetch one extra row to know if there is a next page without a COUNT
+    page = list(queryset.order_by(*keyset_order(descending))[:page_size + 1])
+    next_cursor = None
+    if len(page) > page_size:
+        page = page[:page_size]
+        last = page[-1]
+        next_cursor = encode_cursor(tag, last.sort_key, last.id)
+    return page, next_cursor
+
+
+def paginate_partitions(queryset, partition_field, partitions, sort_field, cursors, page_size):
+    """
+    keyset pagination of several partitions of a queryset in a single query,
+    newest (highest sort_field) first , each partition has its own cursor
+        - partitions : {name: value of partition_field}
+        - cursors    : {name: cursor sent for that partition (or None)}
+    returns {name: (page, next_cursor)}
+    """
+    condition = Q()
+    key_field = queryset.model._meta.get_field(sort_field)
+    for name, value in partitions.items():
+        partition = Q(**{partition_field: value})
+        position = decode_cursor(cursors.get(name), f'{partition_field}:{name}', key_field)
+        if position is not None:
+            key, pk = position
+            partition &= Q(**{f'{sort_field}__lt': key}) | Q(**{sort_field: key, 'id__lt': pk})
+        condition |= partition
+
+    # the rows are numbered inside each partition and every partition is cut
+    # at page_size + 1 rows (to know if it has a next page) by the database
+    rows = (
+        queryset.filter(condition)
+        .annotate(row_number=Window(
+            RowNumber(),
+            partition_by=F(partition_field),
+            order_by=(F(sort_field).desc(), F('id').desc()),
+        ))
+        .filter(row_number__lte=page_size + 1)
+        .order_by(f'-{sort_field}', '-id')
+    )
+    grouped = {value: [] for value in partitions.values()}
+    for row in rows:
+        grouped[getattr(row, partition_field)].append(row)
+
+    pages = {}
+    for name, value in partitions.items():
+        page = grouped[value]
+        next_cursor = None
+        if len(page) > page_size:
+            page = page[:page_size]
+            last = page[-1]
+            next_cursor = encode_cursor(f'{partition_field}:{name}', getattr(last, sort_field), last.id)
+        pages[name] = (page, next_cursor)
+    return pages
+
+
+def paginate_entries(entries, complete, descending, cursor, page_size, tag, key_field):
+    """
+    same pagination over an already ordered list of (sort_key, id) pairs (cached results),
+    returns (page_ids, next_cursor) , or None when the page goes past the end of an
+    incomplete list and has to be read from the database with paginate_keyset
+    """
+    start = 0
+    position = decode_cursor(cursor, tag, key_field)
+    if position is not None:
+        key, pk = position
+        try:
+            if descending:
+                start = next((i for i, entry in enumerate(entries) if tuple(entry) < (key, pk)), len(entries))
+            else:
+                start = next((i for i, entry in enumerate(entries) if tuple(entry) > (key, pk)), len(entries))
+        except TypeError:
+            raise InvalidCursor(cursor)
+
+    page = entries[start:start + page_size + 1]
+    if len(page) <= page_size and not complete:
+        return None
+    next_cursor = None
+    if len(page) > page_size:
+        page = page[:page_size]
+        next_cursor = encode_cursor(tag, *page[-1])
+    return [pk for _, pk in page], next_cursor
+
+
+def fetch_in_order(queryset, ids):
+    """the rows of queryset with the given ids , in the order of ids"""
+    rows = {row.id: row for row in queryset.filter(id__in=ids)}
+    return [rows[pk] for pk in ids if pk in rows]
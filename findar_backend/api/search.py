@@ -0,0 +1,47 @@
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramWordSimilarity
+from django.db.models import F
+
+"""
+    keyword search over the listings
+    the search bar sends a request on every keystroke, so each word is matched as a
+    prefix against the indexed search_vector (title weighted above description);
+    when nothing matches, the title is compared by trigram similarity to catch typos
+"""
+
+
+def prefix_search_query(text):
+    """SearchQuery matching every word of text as a prefix, None if text has no words"""
+    words = re.findall(r'[^\W_]+', text.lower())
+    if not words:
+        return None
+    # the words only contain letters/digits so they can't inject tsquery operators
+    return SearchQuery(
+        ' & '.join(f"{word}:*" for word in words),
+        search_type='raw',
+        config='simple',
+    )
+
+
+def keyword_search(posts, text, limit):
+    """returns up to limit posts matching text, best matches first"""
+    query = prefix_search_query(text)
+    if query is None:
+        return list(posts.order_by('-created_at')[:limit])
+
+    matches = list(
+        posts.filter(search_vector=query)
+        .annotate(rank=SearchRank(F('search_vector'), query))
+        .order_by('-rank', '-created_at')[:limit]
+    )
+    if matches:
+        return matches
+
+    # typo fallback, the word similarity operator (pg_trgm.word_similarity_threshold)
+    # is served by the title trigram index
+    return list(
+        posts.filter(title__trigram_word_similar=text)
+        .annotate(similarity=TrigramWordSimilarity(text, 'title'))
+        .order_by('-similarity', '-created_at')[:limit]
+    )
@@ -3,20 +3,21 @@ from rest_framework.serializers import ValidationError
 import re
 
 from .models import (
-    CustomUser, Post, SavedPosts, Report, BoostingPlan, Boosting
+    CustomUser, Post, SavedPosts, Report, BoostingPlan, Boosting, POST_CARD_FIELDS
 )
 
 class UserSerializers(serializers.ModelSerializer):
     class Meta:
         model = CustomUser
-        exclude = ("password" , "is_superuser" , "is_staff" , "is_active" , "groups" , "user_permissions")
+        exclude = ("password" , "is_superuser" , "is_staff" , "is_active" , "groups" , "user_permissions" , "last_engagement_reminder_at")
 
 class PostSerializers(serializers.ModelSerializer):
     owner_details = serializers.SerializerMethodField()
     
     class Meta:
         model = Post
-        fields= "__all__"
+        exclude = ("search_vector",)
+        read_only_fields = ("geohash", "version")
     
     def get_owner_details(self, obj):
         """Return owner user details"""
@@ -30,6 +31,19 @@ class PostSerializers(serializers.ModelSerializer):
             'account_type': owner.account_type,
         }
 
+class PostCardSerializers(serializers.ModelSerializer):
+    """compact post used by the list endpoints , the full post is only sent by the detail endpoints"""
+    distance = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Post
+        fields = (*POST_CARD_FIELDS, "distance")
+
+    def get_distance(self, obj):
+        """distance in km , only annotated by the location search"""
+        distance = getattr(obj, 'distance', None)
+        return round(distance, 2) if distance is not None else None
+
 class SavedPostsSerializers(serializers.ModelSerializer):
     class Meta:
         model = SavedPosts
@@ -6,13 +6,33 @@ import os
 
 
 
-def send_topic_notification(topic: str, title: str, body: str, data=None):
+# max number of tokens FCM accepts in one multicast message
+FCM_MULTICAST_LIMIT = 500
+
+
+def fcm_batches(items):
+    """items split in lists of at most FCM_MULTICAST_LIMIT , the most FCM accepts per call"""
+    items = list(items)
+    return [items[start:start + FCM_MULTICAST_LIMIT] for start in range(0, len(items), FCM_MULTICAST_LIMIT)]
+
+def delete_unregistered_tokens(tokens):
+    """drops in one query the devices FCM reported as unregistered"""
+    if tokens:
+        from api.models import DeviceToken
+        DeviceToken.objects.filter(token__in=tokens).delete()
+
+
+def init_firebase():
     from config import settings
-        
+
     if not firebase_admin._apps:
         cred = credentials.Certificate(settings.FIREBASE_SERVICE_ACCOUNT)
         firebase_admin.initialize_app(cred)
 
+
+def send_topic_notification(topic: str, title: str, body: str, data=None):
+    init_firebase()
+
     message = messaging.Message(
         notification=messaging.Notification(
             title=title,
@@ -26,11 +46,7 @@ def send_topic_notification(topic: str, title: str, body: str, data=None):
     return response
 
 def send_user_notification(token: str, title: str, body: str, data=None):
-    from config import settings
-
-    if not firebase_admin._apps:
-        cred = credentials.Certificate(settings.FIREBASE_SERVICE_ACCOUNT)
-        firebase_admin.initialize_app(cred)
+    init_firebase()
 
     message = messaging.Message(
         notification=messaging.Notification(
@@ -45,43 +61,139 @@ def send_user_notification(token: str, title: str, body: str, data=None):
     try:
         response = messaging.send(message)
     except UnregisteredError:
-        from api.models import DeviceToken
-        DeviceToken.objects.filter(token=token).delete()
+        delete_unregistered_tokens([token])
     return response
 
+def send_multicast_notification(tokens, title: str, body: str, data=None):
+    """
+    sends the same notification to many devices , FCM_MULTICAST_LIMIT tokens per call,
+    the tokens FCM reports as unregistered are deleted in one query at the end
+    returns the number of devices the notification was delivered to
+    """
+    init_firebase()
+
+    delivered = 0
+    unregistered = []
+    for chunk in fcm_batches(tokens):
+        message = messaging.MulticastMessage(
+            notification=messaging.Notification(
+                title=title,
+                body=body,
+            ),
+            data=data or {},
+            tokens=chunk,
+        )
+        response = messaging.send_each_for_multicast(message)
+        delivered += response.success_count
+        for token, result in zip(chunk, response.responses):
+            if not result.success and isinstance(result.exception, UnregisteredError):
+                unregistered.append(token)
+
+    delete_unregistered_tokens(unregistered)
+    return delivered
+
+def send_outbox_messages(notifications, workers=1):
+    """
+    sends NotificationOutbox rows in FCM batches of FCM_MULTICAST_LIMIT messages,
+    at most workers batches in flight at the same time
+    returns the exception of every row (None when it was delivered) in the same order
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    init_firebase()
+
+    messages = [
+        messaging.Message(
+            notification=messaging.Notification(
+                title=notification.title,
+                body=notification.body,
+            ),
+            data={key: str(value) for key, value in notification.data.items()},
+            **{notification.target_type: notification.target},
+        )
+        for notification in notifications
+    ]
+    def send_chunk(chunk):
+        try:
+            response = messaging.send_each(chunk)
+        except Exception as error:
+            # the whole batch failed (network , auth ...) , every message is retried
+            return [error] * len(chunk)
+        return [None if result.success else result.exception for result in response.responses]
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        return [error for errors in executor.map(send_chunk, fcm_batches(messages)) for error in errors]
+
+def enqueue_topic_notification(topic: str, title: str, body: str, data=None):
+    from api.models import NotificationOutbox
+    return NotificationOutbox.objects.create(
+        target_type='topic', target=topic, title=title, body=body, data=data or {}
+    )
+
+def enqueue_user_notification(token: str, title: str, body: str, data=None):
+    from api.models import NotificationOutbox
+    return NotificationOutbox.objects.create(
+        target_type='token', target=token, title=title, body=body, data=data or {}
+    )
+
 def new_agency_boosting_plans_notification():
     title = "New Boosting Plans Available!"
     body = "Check out our latest boosting plans to enhance your posts' visibility."
     data = {"type": "new_boosting_plans"}
 
-    response = send_topic_notification("agency", title, body, data)
-    return response
+    return enqueue_topic_notification("agency", title, body, data)
 
 def new_individual_boosting_plans_notification():
     title = "New Boosting Plans Available!"
     body = "Check out our latest boosting plans to enhance your posts' visibility."
     data = {"type": "new_boosting_plans"}
 
-    response = send_topic_notification("individual", title, body, data)
-    return response
+    return enqueue_topic_notification("individual", title, body, data)
 
-def reminder_boosting_expiry_notification(user_token: str, post_id: int):
+def boosting_expiry_reminder(post_id: int):
+    """returns the (title, body, data) of the boosting expiry reminder of a post"""
     title = "Boosting Plan Expiry Reminder"
     body = "Your post's boosting plan is about to expire. Renew now to maintain visibility!"
     data = {"type": "boosting_expiry_reminder", "post_id": str(post_id)}
+    return title, body, data
 
-    response = send_user_notification(user_token, title, body, data)
-    return response
+def enqueue_email(to, subject, body):
+    """queues an email for the send_emails worker , the request never waits on SMTP"""
+    from api.models import EmailOutbox
+    return EmailOutbox.objects.create(to=to, subject=subject, body=body)
 
-def send_email(to, subject, body):
-    email = EmailMessage(
-        subject=subject,
-        body=body,
-        to=[to],
-    )
-    email.send(fail_silently=False)
+def send_outbox_emails(emails):
+    """
+    sends EmailOutbox rows over a single SMTP connection
+    returns the exception of every row (None when it was sent) in the same order
+    """
+    from django.core.mail import get_connection
 
-def send_reset_code_email(email, code):
+    connection = get_connection()
+    try:
+        connection.open()
+    except Exception as error:
+        return [error] * len(emails)
+
+    errors = []
+    try:
+        for email in emails:
+            message = EmailMessage(
+                subject=email.subject,
+                body=email.body,
+                to=[email.to],
+                connection=connection,
+            )
+            try:
+                connection.send_messages([message])
+                errors.append(None)
+            except Exception as error:
+                errors.append(error)
+    finally:
+        connection.close()
+    return errors
+
+def queue_reset_code_email(email, code):
     subject = "Your FinDAR password reset code"
     body = f"""
 Hi,
@@ -95,4 +207,4 @@ If you did not request this, ignore this email.
 
 — FinDAR Team
 """
-    send_email(email, subject, body)
+    return enqueue_email(email, subject, body)
@@ -1,3 +1,690 @@
-from django.test import TestCase
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.hashers import make_password
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.contrib.auth import authenticate
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from .authentication import UserRefreshToken
+from .cache import get_counters, incr_counter, touch_last_active
+from .cron import check_almost_expired_boostings, engagement_reminder, expire_boostings
+from .pagination import encode_cursor
+from .search import keyword_search
+from .models import (
+    OTP_MAX_ATTEMPTS, Boosting, BoostingPlan, CustomUser, DeviceToken, EmailOutbox, NotificationOutbox,
+    PasswordResetOTP, Post, SavedPosts,
+)
+
+# the query counts are about the database , keep the cache (redis in production) out of them
+local_cache = override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+
+
+@local_cache
+class ListingQueryCountTests(APITestCase):
+    """
+    every listing endpoint must run a fixed number of queries whatever the number
+    of posts returned (the owner is joined, not fetched once per post)
+    """
+
+    POSTS_PER_OWNER = 5
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(
+            email="viewer@test.com", username="viewer", password="Password123", account_type="individual"
+        )
+        cls.owners = [
+            CustomUser.objects.create_user(
+                email=f"owner{i}@test.com", username=f"owner{i}", password="Password123", account_type="agency"
+            )
+            for i in range(3)
+        ]
+        cls.posts = []
+        for owner in [cls.user, *cls.owners]:
+            for i in range(cls.POSTS_PER_OWNER):
+                cls.posts.append(Post.objects.create(
+                    owner=owner,
+                    title=f"Apartment {i} of {owner.username}",
+                    description="Test listing",
+                    price=1000 * (i + 1),
+                    latitude=36.75 + i * 0.001,
+                    longitude=3.05 + i * 0.001,
+                    listing_type="rent",
+                    building_type="apartment",
+                    boosted=i % 2 == 0,
+                    active=i != 4,
+                ))
+        for post in cls.posts:
+            if post.owner_id != cls.user.id:
+                SavedPosts.objects.create(user=cls.user, post=post)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(self.user)
+
+    def assertQueries(self, count, url, params=None):
+        with self.assertNumQueries(count):
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_sponsored_listings(self):
+        self.assertQueries(1, reverse("sponsored-listings"))
+        # served from the cache until a boosted post changes
+        self.assertQueries(0, reverse("sponsored-listings"))
+        post = Post.objects.get(id=self.posts[0].id)
+        post.active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            post.save()
+        response = self.assertQueries(1, reverse("sponsored-listings"))
+        self.assertNotIn(post.id, [p["id"] for p in response.data])
+
+        # un-boosting clears the feed too
+        post = Post.objects.get(id=self.posts[2].id)
+        post.boosted = False
+        with self.captureOnCommitCallbacks(execute=True):
+            post.save()
+        response = self.assertQueries(1, reverse("sponsored-listings"))
+        self.assertNotIn(post.id, [p["id"] for p in response.data])
+
+    def test_recent_listings(self):
+        self.assertQueries(1, reverse("recent-listings"))
+        self.assertQueries(1, reverse("recent-listings"), {"q": "apartment"})
+
+    def test_advanced_search(self):
+        # ordered ids of the search , then the page of posts
+        self.assertQueries(2, reverse("advanced-search"))
+        self.assertQueries(2, reverse("advanced-search"), {"latitude": 36.75, "longitude": 3.05, "sort_by": "distance"})
+        # the same search is served from the cached ids , only the page is fetched
+        self.assertQueries(1, reverse("advanced-search"), {"latitude": 36.7501, "longitude": 3.0499, "sort_by": "distance"})
+        self.assertQueries(1, reverse("advanced-search"), {"page_size": 3})
+
+    def test_advanced_search_cached_results(self):
+        url = reverse("advanced-search")
+        before = self.client.get(url).data
+        # writes don't flush the cached ids , the posts that stopped matching are left out of the page
+        Post.objects.filter(id=before[0]["id"]).update(active=False)
+        Post.objects.create(owner=self.owners[0], title="New", description="Test listing", price=1)
+        after = self.client.get(url).data
+        self.assertEqual([p["id"] for p in after], [p["id"] for p in before[1:]])
+
+        # new posts show up once the results expire (SEARCH_CACHE_TIMEOUT)
+        cache.clear()
+        self.assertEqual(len(self.client.get(url).data), len(before))
+
+    def test_my_listings(self):
+        response = self.assertQueries(1, reverse("listings"))
+        self.assertEqual(len(response.data["active"]), self.POSTS_PER_OWNER - 1)
+        self.assertEqual(len(response.data["inactive"]), 1)
+
+    def test_my_listings_paginated(self):
+        # one windowed query for the pages of both partitions , one for the counts
+        response = self.assertQueries(2, reverse("listings"), {"page_size": 3})
+        self.assertEqual(response.data["counts"], {"active": self.POSTS_PER_OWNER - 1, "inactive": 1})
+        self.assertEqual(len(response.data["active"]), 3)
+        self.assertEqual(len(response.data["inactive"]), 1)
+        self.assertIsNone(response.data["next"]["inactive"])
+
+        response = self.assertQueries(2, reverse("listings"), {
+            "page_size": 3, "status": "active", "active_cursor": response.data["next"]["active"],
+        })
+        self.assertEqual(len(response.data["active"]), self.POSTS_PER_OWNER - 4)
+        self.assertNotIn("inactive", response.data)
+        self.assertIsNone(response.data["next"]["active"])
+
+    def test_saved_listings(self):
+        response = self.assertQueries(1, reverse("saved-listings"))
+        self.assertEqual(len(response.data), 3 * (self.POSTS_PER_OWNER - 1))
+
+    def test_saved_listing_ids_etag(self):
+        url = reverse("saved-listing-ids")
+        response = self.assertQueries(1, url)
+        self.assertEqual(len(response.data["ids"]), 3 * self.POSTS_PER_OWNER)
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 304)
+
+    def test_bulk_save_listings(self):
+        ids_url = reverse("saved-listing-ids")
+        etag = self.client.get(ids_url)["ETag"]
+        own, saved = self.posts[0].id, self.posts[-1].id
+        SavedPosts.objects.filter(user=self.user, post_id=saved).delete()
+
+        with self.assertNumQueries(3):
+            response = self.client.post(
+                reverse("bulk-save-listings"),
+                {"save": [own, saved, saved], "unsave": [self.posts[-2].id]},
+                format="json",
+            )
+        self.assertEqual(response.data, {"saved": [saved], "unsaved": 1})
+
+        response = self.client.get(ids_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(saved, response.data["ids"])
+        self.assertNotIn(self.posts[-2].id, response.data["ids"])
+
+    def test_save_listing_twice(self):
+        url = reverse("save_listing", args=[self.posts[-1].id])
+        response = self.client.get(url)
+        self.assertEqual(response.data["message"], "Listing already saved")
+        SavedPosts.objects.filter(user=self.user, post=self.posts[-1]).delete()
+        response = self.client.get(url)
+        self.assertEqual(response.data["message"], "Listing saved successfully")
+
+    def test_deleted_post_leaves_the_saved_ids(self):
+        ids_url = reverse("saved-listing-ids")
+        etag = self.client.get(ids_url)["ETag"]
+        deleted = self.posts[-1]
+        with self.captureOnCommitCallbacks(execute=True):
+            Post.objects.get(id=deleted.id).delete()
+
+        response = self.client.get(ids_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(deleted.id, response.data["ids"])
+
+    def test_profile(self):
+        # header , then the listings
+        response = self.assertQueries(2, reverse("update_profile"))
+        self.assertEqual(response.data["data"]["listings_count"], self.POSTS_PER_OWNER - 1)
+        self.assertEqual(len(response.data["data"]["listings"]), self.POSTS_PER_OWNER - 1)
+        self.assertNotIn("listings", response.data)
+        self.assertNotIn("next", response.data)
+        self.assertQueries(1, reverse("update_profile"))
+
+    def test_profile_of_deleted_user(self):
+        user = CustomUser.objects.create_user(
+            email="gone@test.com", username="gone", password="Password123", account_type="individual"
+        )
+        self.client.force_authenticate(user)
+        user.delete()
+        self.assertEqual(self.client.get(reverse("update_profile")).status_code, 404)
+
+    def test_user_profile(self):
+        owner = self.owners[0]
+        url = reverse("get_user_profile", args=[owner.id])
+        response = self.assertQueries(2, url, {"page_size": 3})
+        self.assertEqual(response.data["user"]["listings_count"], self.POSTS_PER_OWNER - 1)
+        self.assertEqual(len(response.data["listings"]), 3)
+
+        # the header is cached , without page_size every listing is returned (the app doesn't paginate)
+        full = self.assertQueries(1, url)
+        self.assertEqual(len(full.data["listings"]), self.POSTS_PER_OWNER - 1)
+        self.assertNotIn("next", full.data)
+        response = self.assertQueries(1, reverse("user-listings", args=[owner.id]), {
+            "page_size": 3, "cursor": response.data["next"],
+        })
+        self.assertEqual(len(response.data["results"]), self.POSTS_PER_OWNER - 4)
+        self.assertIsNone(response.data["next"])
+
+        # toggling a listing updates the count
+        post = Post.objects.filter(owner=owner, active=True).first()
+        post.active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            post.save()
+        response = self.assertQueries(2, url)
+        self.assertEqual(response.data["user"]["listings_count"], self.POSTS_PER_OWNER - 2)
+
+    def test_listing_details(self):
+        self.assertQueries(1, reverse("listing-details", args=[self.posts[0].id]))
+        # both detail endpoints share the cached entry
+        self.assertQueries(0, reverse("get-listing", args=[self.posts[0].id]))
+
+    def test_deleted_listing_details(self):
+        post = Post.objects.create(owner=self.owners[0], title="Deleted", description="Test listing", price=1)
+        urls = [reverse("listing-details", args=[post.id]), reverse("get-listing", args=[post.id])]
+        for url in urls:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            post.delete()
+        for url in urls:
+            self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_listing_details_etag(self):
+        url = reverse("listing-details", args=[self.posts[0].id])
+        etag = self.client.get(url)["ETag"]
+
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        post = Post.objects.get(id=self.posts[0].id)
+        post.title = "Renamed"
+        with self.captureOnCommitCallbacks(execute=True):
+            post.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(response.data["title"], "Renamed")
+
+    def test_concurrent_edits_get_distinct_versions(self):
+        first, second = Post.objects.get(id=self.posts[0].id), Post.objects.get(id=self.posts[0].id)
+        first.title = "First"
+        first.save()
+        second.title = "Second"
+        second.save()
+        self.assertEqual(second.version, first.version + 1)
+        self.assertEqual(Post.objects.get(id=self.posts[0].id).version, second.version)
+
+
+class SearchPaginationTests(APITestCase):
+    """walking the next cursors returns every post once , in order , ties included"""
+
+    # (price , area , group) , the posts of a group share their date and coordinates
+    POSTS = [(100, 50.0, 0), (100, 50.0, 0), (100, None, 1), (200, 80.0, 1), (200, 80.0, 2), (300, None, 2), (150, 0.0, 2)]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(
+            email="pages@test.com", username="pages", password="Password123", account_type="individual"
+        )
+        now = timezone.now()
+        cls.keys = {}
+        for price, area, group in cls.POSTS:
+            post = Post.objects.create(
+                owner=cls.user, title="Paged", description="Test listing", price=price, area=area,
+                latitude=36.75 + group * 0.01, longitude=3.05,
+            )
+            Post.objects.filter(id=post.id).update(created_at=now - timedelta(days=group))
+            # the expected sort keys , distances grow with the group
+            cls.keys[post.id] = {"price": price, "area": area or 0.0, "date": -group, "distance": group}
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(self.user)
+
+    def expected(self, key, descending):
+        return sorted(self.keys, key=lambda pk: (self.keys[pk][key], pk), reverse=descending)
+
+    def walk(self, params):
+        ids, params = [], {**params, "page_size": 2}
+        while True:
+            response = self.client.get(reverse("advanced-search"), params)
+            self.assertEqual(response.status_code, 200)
+            ids += [post["id"] for post in response.data["results"]]
+            if response.data["next"] is None:
+                return ids
+            params["cursor"] = response.data["next"]
+
+    def assertWalks(self):
+        location = {"latitude": 36.75, "longitude": 3.05}
+        for sort_by, key, descending, extra in [
+            ("price_asc", "price", False, {}),
+            ("price_desc", "price", True, {}),
+            ("date_newest", "date", True, {}),
+            ("date_oldest", "date", False, {}),
+            ("area_asc", "area", False, {}),
+            ("area_desc", "area", True, {}),
+            ("distance", "distance", False, location),
+        ]:
+            with self.subTest(sort_by=sort_by):
+                self.assertEqual(self.walk({"sort_by": sort_by, **extra}), self.expected(key, descending))
+
+    def test_walk_every_sort_order(self):
+        self.assertWalks()
+
+    def test_walk_past_the_cached_results(self):
+        # the first pages come from the cached ids , the next ones from the database
+        with mock.patch("api.views.SEARCH_CACHE_MAX_RESULTS", 3):
+            self.assertWalks()
+
+    def test_invalid_cursor_keys(self):
+        url = reverse("advanced-search")
+        for sort_by, key in [("price_asc", "abc"), ("date_newest", "2024-13-45T99:00"), ("date_oldest", 12), ("area_desc", None)]:
+            with self.subTest(sort_by=sort_by):
+                response = self.client.get(url, {"sort_by": sort_by, "cursor": encode_cursor(sort_by, key, 1)})
+                self.assertEqual(response.status_code, 400)
+        response = self.client.get(reverse("listings"), {"active_cursor": encode_cursor("active:active", "abc", 1)})
+        self.assertEqual(response.status_code, 400)
+
+
+class KeywordSearchTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        owner = CustomUser.objects.create_user(
+            email="search@test.com", username="search", password="Password123", account_type="agency"
+        )
+
+        def post(title, description):
+            return Post.objects.create(owner=owner, title=title, description=description, price=1)
+
+        # created first , the description match is the newer one
+        cls.in_title = post("Maison familiale a Oran", "Jardin et garage")
+        cls.in_description = post("Villa a Blida", "Grande maison avec piscine")
+        cls.apartment = post("Apartment in Algiers", "Close to the sea")
+
+    def search(self, text):
+        return keyword_search(Post.objects.all(), text, limit=20)
+
+    def test_words_match_as_prefixes(self):
+        self.assertEqual(self.search("apart"), [self.apartment])
+        # every word must match
+        self.assertEqual(self.search("apart alg"), [self.apartment])
+        self.assertEqual(self.search("apart oran"), [])
+
+    def test_title_ranked_above_description(self):
+        self.assertEqual(self.search("mais"), [self.in_title, self.in_description])
+
+    def test_typo_falls_back_to_trigrams(self):
+        # no word of the query is a prefix of an indexed word
+        self.assertEqual(self.search("apartmnt"), [self.apartment])
+        self.assertEqual(self.search("zzzzzz"), [])
+
+
+@local_cache
+class BoostExpiryTests(APITestCase):
+
+    CARD = {"card_number": "4242424242424242", "card_holder": "Owner", "expiry_date": "12/30", "cvv": "123"}
+
+    def test_expire_boostings(self):
+        owner = CustomUser.objects.create_user(
+            email="owner@test.com", username="owner", password="Password123", account_type="agency"
+        )
+        plan = BoostingPlan.objects.create(duration=7)
+        now = timezone.now()
+        expired, renewed, running = [
+            Post.objects.create(owner=owner, title=title, description="Test listing", price=1, boosted=True)
+            for title in ("expired", "renewed", "running")
+        ]
+        Boosting.objects.create(boost_plan=plan, post=expired, expires_at=now - timedelta(days=1))
+        Boosting.objects.create(boost_plan=plan, post=renewed, expires_at=now - timedelta(days=8))
+        Boosting.objects.create(boost_plan=plan, post=renewed, expires_at=now + timedelta(days=6))
+        Boosting.objects.create(boost_plan=plan, post=running, expires_at=now + timedelta(days=1))
+
+        with self.assertNumQueries(1):
+            expire_boostings()
+
+        boosted = dict(Post.objects.values_list("title", "boosted"))
+        self.assertEqual(boosted, {"expired": False, "renewed": True, "running": True})
+
+    def test_boost_records_a_boosting(self):
+        owner = CustomUser.objects.create_user(
+            email="owner@test.com", username="owner", password="Password123", account_type="agency"
+        )
+        plan = BoostingPlan.objects.create(plan_type="premium", duration=90)
+        post = Post.objects.create(owner=owner, title="Boosted", description="Test listing", price=1)
+        # an earlier boost that already ran out
+        Boosting.objects.create(boost_plan=plan, post=post, expires_at=timezone.now() - timedelta(days=1))
+        self.client.force_authenticate(owner)
+
+        response = self.client.post(
+            reverse("boost_listing", args=[post.id]), {**self.CARD, "plan": "premium", "duration_months": 3}
+        )
+        self.assertEqual(response.status_code, 200)
+
+        boosting = Boosting.objects.latest("id")
+        self.assertEqual(boosting.boost_plan, plan)
+        self.assertAlmostEqual(
+            boosting.expires_at, timezone.now() + timedelta(days=90), delta=timedelta(minutes=1)
+        )
+        # the sweep keeps the re-boost running
+        expire_boostings()
+        post.refresh_from_db()
+        self.assertTrue(post.boosted)
+
+    def test_expired_boost_drops_the_cached_detail(self):
+        owner = CustomUser.objects.create_user(
+            email="owner@test.com", username="owner", password="Password123", account_type="agency"
+        )
+        post = Post.objects.create(owner=owner, title="Boosted", description="Test listing", price=1, boosted=True)
+        Boosting.objects.create(post=post, expires_at=timezone.now() - timedelta(days=1))
+        self.client.force_authenticate(owner)
+        url = reverse("get-listing", args=[post.id])
+        self.assertTrue(self.client.get(url).data["boosted"])
+
+        expire_boostings()
+        self.assertFalse(self.client.get(url).data["boosted"])
+
+
+class NotificationOutboxTests(TestCase):
+
+    def send_each(self, failures):
+        """fake messaging.send_each failing the messages sent to the given targets"""
+        def send_each(messages):
+            results = [
+                mock.Mock(success=(m.topic or m.token) not in failures, exception=Exception("unavailable"))
+                for m in messages
+            ]
+            return mock.Mock(responses=results)
+        return send_each
+
+    def run_worker(self, failures=(), **options):
+        with mock.patch("api.services.init_firebase"), \
+                mock.patch("api.services.messaging.send_each", side_effect=self.send_each(failures)):
+            call_command("send_notifications", stdout=mock.Mock(), **options)
+
+    def test_boosting_plan_is_queued(self):
+        BoostingPlan.objects.create(duration=7, target_audience="agencies")
+        notification = NotificationOutbox.objects.get()
+        self.assertEqual((notification.target_type, notification.target), ("topic", "agency"))
+        self.assertEqual(notification.status, "pending")
+
+    def test_expiry_reminders_are_queued_with_the_claim(self):
+        owner = CustomUser.objects.create_user(
+            email="reminded@test.com", username="reminded", password="Password123", account_type="agency"
+        )
+        DeviceToken.objects.create(user=owner, token="phone")
+        DeviceToken.objects.create(user=owner, token="tablet")
+        plan = BoostingPlan.objects.create(duration=7)
+        NotificationOutbox.objects.all().delete()
+        now = timezone.now()
+        expiring, later = [
+            Boosting.objects.create(
+                boost_plan=plan,
+                post=Post.objects.create(owner=owner, title="Boosted", description="Test listing", price=1),
+                expires_at=expires_at,
+            )
+            for expires_at in (now + timedelta(hours=12), now + timedelta(days=3))
+        ]
+
+        # nothing is sent by the cron job itself , a Firebase outage can't lose the reminders
+        with mock.patch("api.services.messaging") as messaging:
+            check_almost_expired_boostings()
+            check_almost_expired_boostings()
+        self.assertEqual(messaging.method_calls, [])
+
+        reminders = NotificationOutbox.objects.order_by("target")
+        self.assertEqual([(n.target, n.data["post_id"]) for n in reminders], [
+            ("phone", str(expiring.post_id)), ("tablet", str(expiring.post_id)),
+        ])
+        self.assertEqual(dict(Boosting.objects.values_list("id", "notified")), {expiring.id: True, later.id: False})
+
+        self.run_worker(failures={"tablet"})
+        self.assertEqual(dict(reminders.values_list("target", "status")), {"phone": "sent", "tablet": "pending"})
+
+    def test_worker_retries_with_backoff(self):
+        ok = NotificationOutbox.objects.create(target_type="token", target="ok", title="t", body="b")
+        failing = NotificationOutbox.objects.create(target_type="token", target="failing", title="t", body="b")
+
+        self.run_worker(failures={"failing"}, max_attempts=2)
+        ok.refresh_from_db()
+        failing.refresh_from_db()
+        self.assertEqual(ok.status, "sent")
+        self.assertEqual((failing.status, failing.attempts), ("pending", 1))
+        self.assertGreater(failing.next_attempt_at, timezone.now())
+
+        # once due again it fails a second time and is dead lettered
+        NotificationOutbox.objects.filter(id=failing.id).update(next_attempt_at=timezone.now())
+        self.run_worker(failures={"failing"}, max_attempts=2)
+        failing.refresh_from_db()
+        self.assertEqual((failing.status, failing.attempts), ("dead", 2))
+
+
+class PasswordResetTests(APITestCase):
+    """the test runner swaps SMTP for the locmem backend (mail.outbox)"""
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            email="reset@test.com", username="reset", password="Password123", account_type="individual"
+        )
+
+    def verify(self, code):
+        return self.client.post(reverse("password-reset-verify"), {"email": "reset@test.com", "code": code})
+
+    def test_reset_code_is_queued_then_sent(self):
+        response = self.client.post(reverse("password-reset-request"), {"email": "reset@test.com"})
+        self.assertEqual(response.status_code, 200)
+        # nothing is sent inside the request
+        self.assertEqual(len(mail.outbox), 0)
+
+        call_command("send_emails", stdout=mock.Mock())
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ["reset@test.com"])
+        email = EmailOutbox.objects.get()
+        self.assertEqual((email.status, email.body), ("sent", ""))
+
+    def test_dead_email_body_is_cleared(self):
+        self.client.post(reverse("password-reset-request"), {"email": "reset@test.com"})
+        with mock.patch("django.core.mail.backends.locmem.EmailBackend.send_messages", side_effect=Exception("smtp down")):
+            call_command("send_emails", max_attempts=1, stdout=mock.Mock())
+        email = EmailOutbox.objects.get()
+        self.assertEqual((email.status, email.body), ("dead", ""))
+
+        admin = CustomUser.objects.create_user(
+            email="admin@test.com", username="admin", password="Password123", account_type="individual", is_staff=True
+        )
+        self.client.force_authenticate(admin)
+        response = self.client.get(reverse("stats"))
+        self.assertEqual(response.data["email"], {"queued": 1, "pending": 0, "retrying": 0, "sent": 0, "dead": 1})
+
+    def test_verify_code(self):
+        otp = PasswordResetOTP(user=self.user)
+        otp.set_code("123456")
+        otp.save()
+        self.assertTrue(otp.code_hash.startswith("hmac-sha256$"))
+
+        self.assertEqual(self.verify("000000").status_code, 400)
+        self.assertEqual(self.verify("123456").status_code, 200)
+
+        PasswordResetOTP.objects.filter(id=otp.id).update(attempts=OTP_MAX_ATTEMPTS)
+        response = self.verify("123456")
+        self.assertEqual(response.data["message"], "Too many attempts")
+
+    def test_verify_legacy_code(self):
+        PasswordResetOTP.objects.create(user=self.user, code_hash=make_password("654321"))
+        self.assertEqual(self.verify("654321").status_code, 200)
+
+
+class PasswordHasherTests(TestCase):
+
+    def test_password_rehashed_on_login(self):
+        with override_settings(PBKDF2_ITERATIONS=1000):
+            user = CustomUser.objects.create_user(
+                email="hasher@test.com", username="hasher", password="Password123", account_type="individual"
+            )
+        self.assertIn("$1000$", user.password)
+
+        with override_settings(PBKDF2_ITERATIONS=2000):
+            self.assertIsNotNone(authenticate(email="hasher@test.com", password="Password123"))
+        user.refresh_from_db()
+        self.assertIn("$2000$", user.password)
+
+
+class StatelessAuthenticationTests(APITestCase):
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            email="token@test.com", username="token", password="Password123", account_type="agency"
+        )
+        access = UserRefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {access}")
+
+    def test_user_not_loaded_from_token(self):
+        # only the saved listings query , the user comes from the token claims
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse("saved-listings"))
+        self.assertEqual(response.status_code, 200)
+
+    def test_user_loaded_on_demand(self):
+        response = self.client.post(reverse("me"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["email"], "token@test.com")
+
+    def test_token_user_id_matches_owner_id(self):
+        post = Post.objects.create(owner=self.user, title="Owned", description="Test listing", price=1)
+        response = self.client.post(reverse("toggle_active_listing", kwargs={"listing_id": post.id}))
+        self.assertEqual(response.status_code, 200)
+
+
+@override_settings(CACHES={'default': {
+    'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'findar_cache',
+}})
+class DatabaseCacheCounterTests(TestCase):
+
+    def test_counters_are_buffered(self):
+        get_counters(["test.hit"])
+        # no query per hit , the counts are written when read or every COUNTER_FLUSH_INTERVAL
+        with self.assertNumQueries(0):
+            for _ in range(3):
+                incr_counter("test.hit")
+        self.assertEqual(get_counters(["test.hit"]), {"test.hit": 3})
+
+
+@local_cache
+class LastActiveTests(TestCase):
+
+    def test_touch_last_active_is_throttled(self):
+        cache.clear()
+        user = CustomUser.objects.create_user(
+            email="active@test.com", username="active", password="Password123", account_type="individual"
+        )
+        two_days_ago = timezone.now() - timedelta(days=2)
+        CustomUser.objects.filter(id=user.id).update(last_active=two_days_ago)
+
+        # saving the user no longer counts as activity
+        user.refresh_from_db()
+        user.save()
+        user.refresh_from_db()
+        self.assertEqual(user.last_active, two_days_ago)
+
+        with self.assertNumQueries(1):
+            touch_last_active(user.id)
+        with self.assertNumQueries(0):
+            touch_last_active(user.id)
+        user.refresh_from_db()
+        self.assertGreater(user.last_active, two_days_ago)
+
+
+class EngagementReminderTests(TestCase):
+
+    def test_dormant_users_are_reminded_once(self):
+        dormant, active = [
+            CustomUser.objects.create_user(
+                email=f"{name}@test.com", username=name, password="Password123", account_type="individual"
+            )
+            for name in ("dormant", "active")
+        ]
+        CustomUser.objects.filter(id=dormant.id).update(last_active=timezone.now() - timedelta(days=3))
+        DeviceToken.objects.create(user=dormant, token="dormant-device")
+        DeviceToken.objects.create(user=active, token="active-device")
+
+        with mock.patch("api.services.send_multicast_notification") as send:
+            engagement_reminder()
+            engagement_reminder()
+        send.assert_called_once()
+        self.assertEqual(send.call_args.args[0], ["dormant-device"])
+
+
+class DatasetGenerationTests(TestCase):
+
+    def generate(self):
+        call_command("generate_dataset", users=5, posts=20, seed=7, stdout=mock.Mock())
+
+    def test_rerun_with_the_same_seed(self):
+        self.generate()
+        self.generate()
+        self.assertEqual(CustomUser.objects.filter(email__startswith="user0.s7").count(), 2)
+        self.assertEqual(Post.objects.count(), 40)
+
+    def test_failed_run_is_rolled_back(self):
+        with mock.patch.object(DeviceToken.objects, "bulk_create", side_effect=RuntimeError), \
+                self.assertRaises(RuntimeError):
+            self.generate()
+        self.assertFalse(CustomUser.objects.exists())
+        self.assertFalse(Post.objects.exists())
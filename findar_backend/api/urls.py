@@ -7,6 +7,7 @@ from rest_framework_simplejwt.views import (
 
 urlpatterns = [
     path('health-check',health_check, name="health-check"),
+    path('stats/', stats, name="stats"),
     path('get-listing/<int:listing_id>', get_listing, name='get-listing'),
     # authentication urls 
     path('auth/login' , login , name="login"),
@@ -16,13 +17,14 @@ urlpatterns = [
     path('auth/me' , me , name="me"),
     path('auth/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('auth/refresh', CustomTokenRefreshView.as_view(), name='token_refresh'),
-    path("auth/password-reset/request/", PasswordResetRequestAPI.as_view()),
-    path("auth/password-reset/verify/", PasswordResetVerifyCodeAPI.as_view()),
-    path("auth/password-reset/confirm/", PasswordResetConfirmAPI.as_view()),
-    path("notifications/register-device/", register_device_token),
+    path("auth/password-reset/request/", PasswordResetRequestAPI.as_view(), name="password-reset-request"),
+    path("auth/password-reset/verify/", PasswordResetVerifyCodeAPI.as_view(), name="password-reset-verify"),
+    path("auth/password-reset/confirm/", PasswordResetConfirmAPI.as_view(), name="password-reset-confirm"),
+    path("notifications/register-device/", register_device_token, name="register-device"),
     
     path('create-listing/', create_listing, name='create-listing'),
     path('users/<int:user_id>/profile/', get_user_profile, name='get_user_profile'),
+    path('users/<int:user_id>/listings/', user_listings, name='user-listings'),
     path('users/profile', Profile.as_view(), name='update_profile'),
     path('users/profile/', Profile.as_view(), name='update_profile'),
     path('edit-listing/<int:listing_id>', edit_listing, name='edit-listing'),
@@ -32,6 +34,8 @@ urlpatterns = [
     path('login/', login, name='login'),
     path('save_listing/<int:listing_id>', save_listing, name='save_listing'),
     path('saved-listings/', saved_listings, name='saved-listings'),
+    path('saved-listings/ids/', saved_listing_ids, name='saved-listing-ids'),
+    path('saved-listings/bulk/', bulk_save_listings, name='bulk-save-listings'),
     path('register/', register, name='register'),
     path('listing-details/<int:listing_id>', listing_details, name='listing-details'),
     path('sponsored-listings/', sponsored_listings, name='sponsored-listings'),
@@ -5,18 +5,22 @@ from rest_framework import status
 from rest_framework.response import Response 
 from rest_framework.decorators import api_view , permission_classes
 from rest_framework_simplejwt.tokens import RefreshToken
-from rest_framework.permissions import IsAuthenticated
+from .authentication import UserRefreshToken
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.views import APIView
 from django.db.models import Q
-from django.db.models import F, FloatField
-from django.db.models.functions import ACos, Cos, Radians, Sin
+from django.db.models import Count, F, FloatField
+from django.db.models.functions import Coalesce
 
 from rest_framework_simplejwt.views import TokenRefreshView
 from rest_framework_simplejwt.serializers import TokenRefreshSerializer
 
 from django.contrib.auth.hashers import check_password
 import random
+from datetime import timedelta
+from django.db import transaction
 from django.utils import timezone
+from django.utils.http import parse_etags
 from django.contrib.auth.hashers import make_password
 from rest_framework.views import APIView
 from rest_framework.response import Response
@@ -24,6 +28,20 @@ import firebase_admin
 from firebase_admin import credentials, auth as firebase_auth
 
 from .services import *
+from .geo import (
+    DEFAULT_RADIUS_KM, MAX_RADIUS_KM, SEARCH_GRID_DECIMALS, bounding_box_filter, distance_km,
+    geohash_filter,
+)
+from .cache import (
+    CACHE_COUNTERS, SEARCH_CACHE_MAX_RESULTS, get_counters, get_listing_detail, get_profile_header,
+    get_saved_ids, get_search_results, get_sponsored_feed, incr_counter, invalidate_saved_ids, listing_etag,
+    owner_changed, search_cache_key, touch_last_active,
+)
+from .search import keyword_search
+from .pagination import (
+    InvalidCursor, fetch_in_order, get_page_size, keyset_order, paginate_entries, paginate_keyset, paginate_partitions,
+    sort_key_field, wants_pagination,
+)
 """
     for every view that needs a user ( authenticated user ) do 
     @api_view(['GET'])
@@ -38,6 +56,25 @@ def health_check(request):
     return Response({"message": "Successully fetched the health-check endpoint "}, status = status.HTTP_200_OK)
 
 
+######### Stats ##########
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def stats(request):
+    """hit / miss counters of the caches and the state of the email queue , staff only"""
+    # read from the outbox itself , the worker runs in another process
+    emails = EmailOutbox.objects.aggregate(
+        queued=Count('id'),
+        pending=Count('id', filter=Q(status='pending', attempts=0)),
+        retrying=Count('id', filter=Q(status='pending', attempts__gt=0)),
+        sent=Count('id', filter=Q(status='sent')),
+        dead=Count('id', filter=Q(status='dead')),
+    )
+    return Response({
+        "cache": get_counters(CACHE_COUNTERS),
+        "email": emails,
+    }, status = status.HTTP_200_OK)
+
+
 #########  LISTINGS VIEW  #########
 
 
@@ -46,8 +83,13 @@ def health_check(request):
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def sponsored_listings(request):
-    sponsored_posts = Post.objects.filter(boosted=True , active=True)
-    serialized_posts = PostSerializers(sponsored_posts , many=True).data
+    # the same feed is shown to everyone and rarely changes , it is served from the cache
+    # and rebuilt after a post is boosted , edited , toggled or its boost expires
+    def build_feed():
+        sponsored_posts = Post.objects.cards().filter(boosted=True , active=True)
+        return list(PostCardSerializers(sponsored_posts , many=True).data)
+
+    serialized_posts = get_sponsored_feed(build_feed)
     return Response(serialized_posts , status=status.HTTP_200_OK)
 
 
@@ -62,27 +104,44 @@ def recent_listings(request):
     q = '' if q is None else q
     listing_type = request.query_params.get('listing_type' , None) # rent / sale
 
-    recent_posts = Post.objects.filter(active=True)
+    recent_posts = Post.objects.cards().filter(active=True)
     if listing_type in ['rent' , 'sale']:
         recent_posts = recent_posts.filter(listing_type=listing_type)
-    recent_posts = recent_posts.filter(Q(title__icontains=q) | Q(description__icontains=q))
-    recent_posts = recent_posts.order_by('-created_at')[:20] # for now, get the 20 most recent active posts after filtering
-    serialized_posts = PostSerializers(recent_posts , many=True).data
+    # for now, get the 20 best matching (or most recent without q) active posts after filtering
+    recent_posts = keyword_search(recent_posts, q, limit=20)
+    serialized_posts = PostCardSerializers(recent_posts , many=True).data
     return Response(serialized_posts , status=status.HTTP_200_OK)
 
 
 #########get listing VIEW#########
 
+def listing_detail_response(request, listing_id, active_only):
+    """
+    serves the full listing from the cache with an ETag derived from the post version,
+    a client sending the same ETag back in If-None-Match gets an empty 304
+    """
+    def build_entry():
+        try:
+            post = Post.objects.listings().get(id=listing_id)
+        except Post.DoesNotExist:
+            return None
+        return {"etag": listing_etag(post), "active": post.active, "data": PostSerializers(post).data}
+
+    entry = get_listing_detail(listing_id, build_entry)
+    if entry is None or (active_only and not entry["active"]):
+        return Response({'errors':"not found"} , status=status.HTTP_404_NOT_FOUND)
+
+    headers = {"ETag": entry["etag"], "Cache-Control": "private, no-cache"}
+    if entry["etag"] in parse_etags(request.headers.get("If-None-Match", "")):
+        incr_counter('listing_detail.not_modified')
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(entry["data"] , status=status.HTTP_200_OK, headers=headers)
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_listing(request , listing_id):
-    try:
-        post = Post.objects.get(id=listing_id , active=True)
-    except Post.DoesNotExist:
-        return Response({'errors':"not found"} , status=status.HTTP_404_NOT_FOUND)
-    
-    serialized_post = PostSerializers(post).data
-    return Response(serialized_post , status=status.HTTP_200_OK)
+    return listing_detail_response(request, listing_id, active_only=True)
 
 
 #########Advanced Search VIEW#########
@@ -93,21 +152,22 @@ def advanced_search(request):
     """
     this will be used after submitting the advanced search screen to go the search results screen
     user can filter by :
-        - location (latitude , longitude)
+        - location (latitude , longitude) within radius_km (default 20 , max 200)
         - price range (min , max)
         - property type (Any ,for sale, for rent)
         - Building type (House, apartment, condo , townhouse)
         - # bedrooms, # bathrooms
     user can sort by:
         - price (ascending/descending)
-        - distance (when location provided)
+        - distance (when location provided , sort_by=distance)
         - date_posted (newest/oldest)
         - area/sqft (ascending/descending)
+    pagination (optional):
+        - page_size : number of posts per page (max 100)
+        - cursor    : the "next" value returned with the previous page
+        when any of them is sent the response is {"results": [...], "next": cursor or null}
     """
-    #constants
-    radius_km = 20
-    earth_radius_km = 6371
-    posts = Post.objects.filter(active=True)
+    posts = Post.objects.cards().filter(active=True)
     
     # filtering logic here
     latitude        = request.query_params.get('latitude' , None)
@@ -122,59 +182,127 @@ def advanced_search(request):
     max_sqft        = request.query_params.get('max_sqft' , None)
     listed_by       = request.query_params.get('listed_by' , None) # normal / agency
     sort_by         = request.query_params.get('sort_by', 'date_posted')  # New parameter
+    radius_km       = request.query_params.get('radius_km' , None)
     
-    if latitude and longitude:
-        latitude  = float(latitude)
-        longitude = float(longitude)
-        # calculate distance using Haversine formula
+    has_location = bool(latitude and longitude)
+    if has_location:
+        # snapped to a ~100m grid so users searching around the same place share cached results
+        latitude  = round(float(latitude), SEARCH_GRID_DECIMALS)
+        longitude = round(float(longitude), SEARCH_GRID_DECIMALS)
+        radius_km = float(radius_km) if radius_km else DEFAULT_RADIUS_KM
+        radius_km = max(0.0, min(radius_km, MAX_RADIUS_KM))
+    min_price     = float(min_price) if min_price else None
+    max_price     = float(max_price) if max_price else None
+    listing_type  = listing_type if listing_type in ['rent' , 'sale'] else None
+    building_type = building_type.lower() if building_type else None
+    building_type = building_type if building_type in dict(BUILDING_TYPE_CHOICES).keys() else None
+    num_bedrooms  = int(num_bedrooms) if num_bedrooms else None
+    num_bathrooms = int(num_bathrooms) if num_bathrooms else None
+    min_sqft      = float(min_sqft) if min_sqft else None
+    max_sqft      = float(max_sqft) if max_sqft else None
+    listed_by     = listed_by if listed_by in dict(ACCOUNT_CHOICES).keys() else None
+
+    if has_location:
+        # the geohash cells and the bounding box use indexes to drop far away posts,
+        # the exact distance is only computed for the candidates left
+        nearby_cells = geohash_filter(latitude, longitude, radius_km)
+        if nearby_cells is not None:
+            posts = posts.filter(nearby_cells)
+        posts = posts.filter(**bounding_box_filter(latitude, longitude, radius_km))
         posts = posts.annotate(
-            distance=earth_radius_km * ACos(
-                Cos(Radians(latitude)) * Cos(Radians(F('latitude'))) *
-                Cos(Radians(F('longitude')) - Radians(longitude)) +
-                Sin(Radians(latitude)) * Sin(Radians(F('latitude')))
-            )
+            distance=distance_km(latitude, longitude)
         ).filter(distance__lte=radius_km)
     
-    if min_price:
-        posts = posts.filter(price__gte=float(min_price))
-    if max_price:
-        posts = posts.filter(price__lte=float(max_price))
-    if listing_type and listing_type in ['rent' , 'sale']:
+    if min_price is not None:
+        posts = posts.filter(price__gte=min_price)
+    if max_price is not None:
+        posts = posts.filter(price__lte=max_price)
+    if listing_type:
         posts = posts.filter(listing_type=listing_type)
     if building_type:
-        building_type = building_type.lower()
-        if building_type in dict(BUILDING_TYPE_CHOICES).keys():
-            posts = posts.filter(building_type=building_type)
-    if num_bedrooms:
-        posts = posts.filter(bedrooms__gte=int(num_bedrooms))
-    if num_bathrooms:
-        posts = posts.filter(bathrooms__gte=int(num_bathrooms))
-    if min_sqft:
-        posts = posts.filter(area__gte=float(min_sqft))
-    if max_sqft:
-        posts = posts.filter(area__lte=float(max_sqft))
-    if listed_by in dict(ACCOUNT_CHOICES).keys():
+        posts = posts.filter(building_type=building_type)
+    if num_bedrooms is not None:
+        posts = posts.filter(bedrooms__gte=num_bedrooms)
+    if num_bathrooms is not None:
+        posts = posts.filter(bathrooms__gte=num_bathrooms)
+    if min_sqft is not None:
+        posts = posts.filter(area__gte=min_sqft)
+    if max_sqft is not None:
+        posts = posts.filter(area__lte=max_sqft)
+    if listed_by:
         posts = posts.filter(owner__account_type=listed_by)
     
-    # Sorting logic
+    # Sorting logic : sort_by -> (sort key , descending)
+    # the id is always used as a tiebreaker so the order is stable between pages
     sort_mapping = {
-        'price_asc': 'price',
-        'price_desc': '-price',
-        'date_newest': '-created_at',
-        'date_oldest': 'created_at',
-        'area_asc': 'area',
-        'area_desc': '-area',
+        'price_asc': (F('price'), False),
+        'price_desc': (F('price'), True),
+        'date_newest': (F('created_at'), True),
+        'date_oldest': (F('created_at'), False),
+        'area_asc': (Coalesce(F('area'), 0.0), False),
+        'area_desc': (Coalesce(F('area'), 0.0), True),
     }
+    if has_location:
+        sort_mapping['distance'] = (F('distance'), False)
     
-    # Apply sorting
-    if sort_by in sort_mapping:
-        posts = posts.order_by(sort_mapping[sort_by])
-    else:
-        # Default sort by newest first
-        posts = posts.order_by('-created_at')
-    
-    serialized_posts = PostSerializers(posts , many=True).data
-    return Response(serialized_posts , status=status.HTTP_200_OK)
+    # Default sort by newest first
+    if sort_by not in sort_mapping:
+        sort_by = 'date_newest'
+    sort_key, descending = sort_mapping[sort_by]
+
+    # the ordered (sort key , id) pairs of a search are cached , only the page returned
+    # to the user is fetched from the posts table
+    search_key = search_cache_key({
+        'location': [latitude, longitude, radius_km] if has_location else None,
+        'price': [min_price, max_price],
+        'listing_type': listing_type,
+        'building_type': building_type,
+        'bedrooms': num_bedrooms,
+        'bathrooms': num_bathrooms,
+        'area': [min_sqft, max_sqft],
+        'listed_by': listed_by,
+        'sort_by': sort_by,
+    })
+    results = get_search_results(
+        search_key,
+        lambda: list(
+            posts.annotate(sort_key=sort_key)
+            .order_by(*keyset_order(descending))
+            .values_list('sort_key', 'id')[:SEARCH_CACHE_MAX_RESULTS + 1]
+        ),
+    )
+    complete = len(results) <= SEARCH_CACHE_MAX_RESULTS
+
+    if not wants_pagination(request):
+        if not complete:
+            posts = posts.annotate(sort_key=sort_key).order_by(*keyset_order(descending))
+            serialized_posts = PostCardSerializers(posts , many=True).data
+            return Response(serialized_posts , status=status.HTTP_200_OK)
+        page = fetch_in_order(posts, [pk for _, pk in results])
+        serialized_posts = PostCardSerializers(page , many=True).data
+        return Response(serialized_posts , status=status.HTTP_200_OK)
+
+    # cursor pagination mode
+    cursor = request.query_params.get('cursor')
+    page_size = get_page_size(request)
+    try:
+        cached_page = paginate_entries(
+            results[:SEARCH_CACHE_MAX_RESULTS], complete, descending, cursor, page_size, tag=sort_by,
+            key_field=sort_key_field(posts, sort_key),
+        )
+        if cached_page is not None:
+            page_ids, next_cursor = cached_page
+            page = fetch_in_order(posts, page_ids)
+        else:
+            # deeper than the cached results , continue from the database with the same cursor
+            page, next_cursor = paginate_keyset(
+                posts, sort_key, descending, cursor=cursor, page_size=page_size, tag=sort_by,
+            )
+    except InvalidCursor:
+        return Response({'errors':"invalid cursor"} , status=status.HTTP_400_BAD_REQUEST)
+
+    serialized_posts = PostCardSerializers(page , many=True).data
+    return Response({"results": serialized_posts , "next": next_cursor} , status=status.HTTP_200_OK)
 
     
 ######## Save a listing VIEW#########
@@ -182,45 +310,94 @@ def advanced_search(request):
 @api_view(["GET", "DELETE"])
 @permission_classes([IsAuthenticated])
 def save_listing(request , listing_id ):
-    try:
-        post = Post.objects.get(id=listing_id)
-    except Post.DoesNotExist:
-        return Response({'errors':"not found"} , status=status.HTTP_404_NOT_FOUND)
-    
     # Get authenticated user ID
     user_id = request.user.id
-    
+
     # Handle DELETE request (unsave)
     if request.method == "DELETE":
-        try:
-            saved_post = SavedPosts.objects.get(user=user_id, post=post)
-            saved_post.delete()
-            return Response({"message": "Listing unsaved successfully"}, status=status.HTTP_200_OK)
-        except SavedPosts.DoesNotExist:
+        deleted, _ = SavedPosts.objects.filter(user_id=user_id, post_id=listing_id).delete()
+        if not deleted:
             return Response({"error": "Listing was not saved"}, status=status.HTTP_404_NOT_FOUND)
-    
+        invalidate_saved_ids(user_id)
+        return Response({"message": "Listing unsaved successfully"}, status=status.HTTP_200_OK)
+
     # Handle GET request (save)
-    if post.owner.id == user_id:
+    owner_id = Post.objects.filter(id=listing_id).values_list('owner_id', flat=True).first()
+    if owner_id is None:
+        return Response({'errors':"not found"} , status=status.HTTP_404_NOT_FOUND)
+    if owner_id == user_id:
         return Response({"error" : "you cant save your posts"} , status=status.HTTP_400_BAD_REQUEST)
-    
-    # Check if already saved
-    if SavedPosts.objects.filter(user=user_id, post=post).exists():
-        return Response({"message": "Listing already saved"}, status=status.HTTP_200_OK)
-    
-    data = {
-        "user": user_id,
-        "post": post.id
-    }
 
-    serializer = SavedPostsSerializers(data=data)
-    
-    if not serializer.is_valid():
-        return Response({"errors" : serializer.errors},status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-    
-    serializer.save()
+    # saving twice is a no-op (unique user , post)
+    _, created = SavedPosts.objects.get_or_create(user_id=user_id, post_id=listing_id)
+    if not created:
+        return Response({"message": "Listing already saved"}, status=status.HTTP_200_OK)
+    invalidate_saved_ids(user_id)
     return Response({"message": "Listing saved successfully"}, status=status.HTTP_200_OK)
 
 
+MAX_BULK_SAVE = 100
+
+@api_view(["POST"])
+@permission_classes([IsAuthenticated])
+def bulk_save_listings(request):
+    """
+    saves and unsaves many listings at once
+    body : {"save": [listing ids], "unsave": [listing ids]} (at most MAX_BULK_SAVE ids each)
+    the user's own listings and unknown ids are ignored
+    """
+    user_id = request.user.id
+    try:
+        save_ids = request.data.get("save", [])
+        unsave_ids = request.data.get("unsave", [])
+        if not isinstance(save_ids, list) or not isinstance(unsave_ids, list):
+            raise TypeError
+        save_ids = {int(i) for i in save_ids}
+        unsave_ids = {int(i) for i in unsave_ids}
+    except (TypeError, ValueError):
+        return Response({"error": "save and unsave must be lists of listing ids"}, status=status.HTTP_400_BAD_REQUEST)
+    if len(save_ids) > MAX_BULK_SAVE or len(unsave_ids) > MAX_BULK_SAVE:
+        return Response({"error": f"at most {MAX_BULK_SAVE} ids per list"}, status=status.HTTP_400_BAD_REQUEST)
+
+    saved = []
+    if save_ids:
+        saved = list(
+            Post.objects.filter(id__in=save_ids).exclude(owner_id=user_id).values_list('id', flat=True)
+        )
+        SavedPosts.objects.bulk_create(
+            [SavedPosts(user_id=user_id, post_id=post_id) for post_id in saved],
+            ignore_conflicts=True,
+        )
+    unsaved = 0
+    if unsave_ids:
+        unsaved, _ = SavedPosts.objects.filter(user_id=user_id, post_id__in=unsave_ids).delete()
+
+    invalidate_saved_ids(user_id)
+    return Response({"saved": sorted(saved), "unsaved": unsaved}, status=status.HTTP_200_OK)
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def saved_listing_ids(request):
+    """
+    ids of every listing the user saved , to render the save buttons of any page of cards,
+    cached per user with an ETag (304 when If-None-Match matches)
+    """
+    user_id = request.user.id
+
+    def build_ids():
+        return list(
+            SavedPosts.objects.filter(user_id=user_id).order_by('post_id').values_list('post_id', flat=True)
+        )
+
+    entry = get_saved_ids(user_id, build_ids)
+    headers = {"ETag": entry["etag"], "Cache-Control": "private, no-cache"}
+    if entry["etag"] in parse_etags(request.headers.get("If-None-Match", "")):
+        incr_counter('saved_ids.not_modified')
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response({"ids": entry["ids"]}, status=status.HTTP_200_OK, headers=headers)
+
+
 ######## Saved listing VIEW#########
 
 @api_view(["GET"])
@@ -228,10 +405,13 @@ def save_listing(request , listing_id ):
 def saved_listings(request):
     # Get authenticated user ID
     user_id = request.user.id
-    saved_posts = SavedPosts.objects.filter(user=user_id).select_related('post')
-    # Extract the actual Post objects from SavedPosts
-    posts = [saved.post for saved in saved_posts if saved.post.active]
-    serialized_posts = PostSerializers(posts, many=True).data
+    # one query joining the saved rows , most recently saved first
+    posts = (
+        Post.objects.cards()
+        .filter(savedposts__user=user_id, active=True)
+        .order_by('-savedposts__saved_at')
+    )
+    serialized_posts = PostCardSerializers(posts, many=True).data
     return Response(serialized_posts, status=status.HTTP_200_OK)
 
 
@@ -243,37 +423,71 @@ def listing_details(request, listing_id):
     """
     user can view the details of a specific listing
     """
-    try:
-        post = Post.objects.get(id=listing_id)
-    except Post.DoesNotExist:
-        return Response({'errors':"not found"} , status=status.HTTP_404_NOT_FOUND)
-    
-    post = PostSerializers(post).data
-    return Response(post , status=status.HTTP_200_OK)
+    return listing_detail_response(request, listing_id, active_only=False)
     
 
 ######## My Listings VIEW#########
 
+MY_LISTINGS_PARTITIONS = {"active": True, "inactive": False}
+
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
 def my_listings(request):
     """
     user can view his own listings
-    in the ui there is an option to filter by online / offline listings
+    in the ui there is an option to filter by online / offline listings (status=active|inactive)
+    the full posts are returned (not the cards) since the edit screen is filled from them
+
+    when page_size or a cursor is sent, each partition is paginated on its own
+    (active_cursor , inactive_cursor) and the counts of both are returned
     """
     # Get authenticated user ID
     user_id = request.user.id
-    posts = Post.objects.filter(owner_id=user_id)
-    active_posts   = posts.filter(active=True )
-    inactive_posts = posts.filter(active=False)
-    active_posts   = PostSerializers(active_posts , many=True).data
-    inactive_posts = PostSerializers(inactive_posts , many=True).data
-    return Response({
-            "active":active_posts,
-            "inactive":inactive_posts,
-        },
-        status=status.HTTP_200_OK
+    status_filter = request.query_params.get('status')
+    if status_filter and status_filter not in MY_LISTINGS_PARTITIONS:
+        return Response({'errors': "status must be active or inactive"}, status=status.HTTP_400_BAD_REQUEST)
+    partitions = {
+        name: value for name, value in MY_LISTINGS_PARTITIONS.items()
+        if not status_filter or name == status_filter
+    }
+    posts = Post.objects.listings().filter(owner_id=user_id)
+
+    paginated = wants_pagination(request) or any(
+        f'{name}_cursor' in request.query_params for name in MY_LISTINGS_PARTITIONS
     )
+    if not paginated:
+        # one query , split in python
+        grouped = {name: [] for name in MY_LISTINGS_PARTITIONS}
+        for post in posts.filter(active__in=partitions.values()).order_by('-created_at', '-id'):
+            grouped["active" if post.active else "inactive"].append(post)
+        return Response({
+                name: PostSerializers(grouped_posts, many=True).data
+                for name, grouped_posts in grouped.items()
+            },
+            status=status.HTTP_200_OK
+        )
+
+    try:
+        pages = paginate_partitions(
+            posts,
+            'active',
+            partitions,
+            'created_at',
+            {name: request.query_params.get(f'{name}_cursor') for name in partitions},
+            get_page_size(request),
+        )
+    except InvalidCursor:
+        return Response({'errors':"invalid cursor"} , status=status.HTTP_400_BAD_REQUEST)
+
+    # COUNT(*) FILTER (WHERE ...) of both partitions in one query
+    counts = Post.objects.filter(owner_id=user_id).aggregate(**{
+        f'{name}_count': Count('id', filter=Q(active=value))
+        for name, value in MY_LISTINGS_PARTITIONS.items()
+    })
+    response = {name: PostSerializers(page, many=True).data for name, (page, _) in pages.items()}
+    response["next"] = {name: next_cursor for name, (_, next_cursor) in pages.items()}
+    response["counts"] = {name: counts[f'{name}_count'] for name in MY_LISTINGS_PARTITIONS}
+    return Response(response, status=status.HTTP_200_OK)
 
 ######## create Listing VIEW#########
 
@@ -304,7 +518,7 @@ def edit_listing(request , listing_id):
         return Response({'errors':"not found"} , status=status.HTTP_404_NOT_FOUND)
     
     # Check if user owns the listing
-    if post.owner.id != request.user.id:
+    if post.owner_id != request.user.id:
         return Response({"error" : "dont have permission"} , status=status.HTTP_401_UNAUTHORIZED)
     
     serializer = PostSerializers(post , data=request.data , partial=True)
@@ -326,7 +540,7 @@ def toggle_active_listing(request , listing_id):
     
     # Get authenticated user ID
     user_id = request.user.id
-    if post.owner.id != user_id:
+    if post.owner_id != user_id:
         return Response({"error" : "dont have permission"} , status=status.HTTP_401_UNAUTHORIZED)
     
     print(f"DEBUG TOGGLE - Before: Post ID {post.id}, active={post.active}")
@@ -349,7 +563,7 @@ def boost_listing(request, listing_id):
         return Response({'error': "Listing not found"}, status=status.HTTP_404_NOT_FOUND)
     
     # Verify the user owns the listing
-    if post.owner.id != request.user.id:
+    if post.owner_id != request.user.id:
         return Response({"error": "You don't have permission to boost this listing"}, status=status.HTTP_403_FORBIDDEN)
     
     # Get card information from request body
@@ -368,9 +582,24 @@ def boost_listing(request, listing_id):
     # No actual payment verification - just accept the card info
     # In production, you would integrate with a payment gateway here
     
-    # Set listing as boosted
-    post.boosted = True
-    post.save()
+    # the app sends the plan it sells (basic / premium / agency) and its duration
+    try:
+        duration_months = int(request.data.get('duration_months', 1))
+    except (TypeError, ValueError):
+        duration_months = 1
+    duration_months = max(1, min(duration_months, MAX_BOOST_MONTHS))
+    plan = BoostingPlan.objects.filter(plan_type__iexact=request.data.get('plan') or '').order_by('id').first()
+
+    # the Boosting row is what expire_boostings un-boosts the post from , a boost
+    # without one would be reverted by the sweep if an older boosting expired
+    with transaction.atomic():
+        Boosting.objects.create(
+            boost_plan=plan,
+            post=post,
+            expires_at=timezone.now() + timedelta(days=BOOST_DAYS_PER_MONTH * duration_months),
+        )
+        post.boosted = True
+        post.save()
     
     return Response({
         "message": "Listing boosted successfully",
@@ -381,15 +610,59 @@ def boost_listing(request, listing_id):
 
 #########  Update Profile  #########
 
+def profile_header(user_id):
+    """the cached user fields and active listings count of a profile , None if the user doesn't exist"""
+    def build_header():
+        user = (
+            CustomUser.objects
+            .annotate(listings_count=Count('post', filter=Q(post__active=True)))
+            .filter(id=user_id)
+            .first()
+        )
+        if user is None:
+            return None
+        return {**UserSerializers(user).data, "listings_count": user.listings_count}
+
+    return get_profile_header(user_id, build_header)
+
+
+def profile_listings_page(request, user_id):
+    """a page of the user's active listings (newest first) , raises InvalidCursor"""
+    listings = Post.objects.cards().filter(owner_id=user_id, active=True)
+    page, next_cursor = paginate_keyset(
+        listings, F('created_at'), True, request.query_params.get('cursor'), get_page_size(request), 'profile',
+    )
+    return PostCardSerializers(page, many=True).data, next_cursor
+
+
+def profile_listings(request, user_id):
+    """
+    every active listing of the user , or only the first page (and its next cursor)
+    when the app sends page_size or cursor , raises InvalidCursor
+    """
+    if wants_pagination(request):
+        return profile_listings_page(request, user_id)
+    listings = Post.objects.cards().filter(owner_id=user_id, active=True).order_by('-created_at', '-id')
+    return PostCardSerializers(listings, many=True).data, None
+
+
 class Profile(APIView):
     permission_classes = [IsAuthenticated]
     def get(self, request):
-        user = request.user
-        serializer = UserSerializers(user)
-        listings = Post.objects.filter(owner=request.user.id, active=True).order_by('-created_at')
-        listings_data = PostSerializers(listings, many=True).data
-        print(serializer.data['username'])
-        return Response({"message":"way" , "success":True , "data": {**serializer.data ,"listings":listings_data} , "listings":listings_data}, status=status.HTTP_200_OK)
+        """the profile header and the listings , paginated ones continue from user-listings"""
+        header = profile_header(request.user.id)
+        if header is None:
+            # deleted user with a token still valid
+            return Response({"success": False, "message": "User not found"}, status=status.HTTP_404_NOT_FOUND)
+        try:
+            listings_data, next_cursor = profile_listings(request, request.user.id)
+        except InvalidCursor:
+            return Response({'errors':"invalid cursor"} , status=status.HTTP_400_BAD_REQUEST)
+        # the listings are only sent once , in data (where the app reads them)
+        response = {"message":"way" , "success":True , "data": {**header ,"listings":listings_data}}
+        if wants_pagination(request):
+            response["next"] = next_cursor
+        return Response(response, status=status.HTTP_200_OK)
     
     def put(self, request):
         full_name = request.data.get("name")
@@ -403,7 +676,7 @@ class Profile(APIView):
             )
         user = CustomUser.objects.get(id=request.user.id)
 
-        if email is not None and email != request.user.email:
+        if email is not None and email != user.email:
             return Response( {"success":False , "message":"cant change email"} , status=status.HTTP_400_BAD_REQUEST )
 
         if phone_number is not None:
@@ -427,6 +700,8 @@ class Profile(APIView):
             user.profile_pic = profile_pic
 
         user.save()
+        # the owner details embedded in the user's posts changed
+        owner_changed(user.id)
         user = UserSerializers(user).data
         print( user )
 
@@ -438,31 +713,37 @@ class Profile(APIView):
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
 def get_user_profile(request, user_id):
-    """Get user profile by ID with their listings"""
-    try:
-        user = CustomUser.objects.get(id=user_id)
-        user_data = UserSerializers(user).data
-        
-        # Get user's listings
-        listings = Post.objects.filter(owner=user_id, active=True).order_by('-created_at')
-        listings_data = PostSerializers(listings, many=True).data
-        
-        return Response({
-            "success": True,
-            "user": user_data,
-            "listings": listings_data
-        }, status=status.HTTP_200_OK)
-        
-    except CustomUser.DoesNotExist:
+    """Get user profile by ID with their listings (the first page when paginated)"""
+    header = profile_header(user_id)
+    if header is None:
         return Response({
             "success": False,
             "message": "User not found"
         }, status=status.HTTP_404_NOT_FOUND)
-    except Exception as e:
-        return Response({
-            "success": False,
-            "message": str(e)
-        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    try:
+        listings_data, next_cursor = profile_listings(request, user_id)
+    except InvalidCursor:
+        return Response({'errors':"invalid cursor"} , status=status.HTTP_400_BAD_REQUEST)
+
+    response = {
+        "success": True,
+        "user": header,
+        "listings": listings_data,
+    }
+    if wants_pagination(request):
+        response["next"] = next_cursor
+    return Response(response, status=status.HTTP_200_OK)
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def user_listings(request, user_id):
+    """next pages of the listings of a profile (cursor from the profile response)"""
+    try:
+        listings_data, next_cursor = profile_listings_page(request, user_id)
+    except InvalidCursor:
+        return Response({'errors':"invalid cursor"} , status=status.HTTP_400_BAD_REQUEST)
+    return Response({"results": listings_data, "next": next_cursor}, status=status.HTTP_200_OK)
 
 
 #########  Login as User  #########
@@ -488,7 +769,8 @@ def login(request):
     if not user:
         return Response("incorrect email or password", status=status.HTTP_400_BAD_REQUEST)
 
-    refresh = RefreshToken.for_user(user)
+    touch_last_active(user.id)
+    refresh = UserRefreshToken.for_user(user)
     #serialize user
     user = RegisterSerializer(user).data
 
@@ -561,8 +843,9 @@ def oauth(request):
                         account_type='individual',
                 )
 
+        touch_last_active(user.id)
         # Generate JWT tokens
-        refresh = RefreshToken.for_user(user)
+        refresh = UserRefreshToken.for_user(user)
         user_data = RegisterSerializer(user).data
         print(user_data)
 
@@ -602,7 +885,7 @@ def logout(request):
         token = RefreshToken(refresh_token)
         # Remove device token from backend
         if device_token:
-            DeviceToken.objects.filter(user=request.user, token=device_token).delete()
+            DeviceToken.objects.filter(user_id=request.user.id, token=device_token).delete()
         token.blacklist()
         return Response({"message": "Logout successful"}, status=status.HTTP_200_OK)
     except Exception as e:
@@ -628,7 +911,7 @@ def register(request):
     
     user = serializer.save()
     
-    refresh = RefreshToken.for_user(user)
+    refresh = UserRefreshToken.for_user(user)
     user = RegisterSerializer(user).data
 
     response = Response({
@@ -671,7 +954,7 @@ def report_property(request):
         # Create report entry
         report = Report.objects.create(
             post=property_post,
-            user=request.user,
+            user_id=request.user.id,
             reason=issue_description[:500],  # Limit to 500 characters
         )
         
@@ -706,7 +989,7 @@ def register_device_token(request):
         )
 
     # 1️⃣ If token already registered for THIS user → OK
-    if DeviceToken.objects.filter(user=request.user, token=token).exists():
+    if DeviceToken.objects.filter(user_id=request.user.id, token=token).exists():
         return Response(
             {
                 "message": "Device token already registered",
@@ -716,11 +999,11 @@ def register_device_token(request):
         )
 
     # 2️⃣ If token exists for ANOTHER user → remove it
-    DeviceToken.objects.filter(token=token).exclude(user=request.user).delete()
+    DeviceToken.objects.filter(token=token).exclude(user_id=request.user.id).delete()
 
     # 3️⃣ Create token for current user
     DeviceToken.objects.create(
-        user=request.user,
+        user_id=request.user.id,
         token=token
     )
 
@@ -746,12 +1029,12 @@ class PasswordResetRequestAPI(APIView):
 
         code = f"{random.randint(0, 999999):06d}"
 
-        PasswordResetOTP.objects.create(
-            user=user,
-            code_hash=make_password(code)
-        )
+        otp = PasswordResetOTP(user=user)
+        otp.set_code(code)
+        otp.save()
 
-        send_reset_code_email(user.email, code)
+        # queued , the send_emails worker delivers it
+        queue_reset_code_email(user.email, code)
 
         return Response({"message": "code has been sent" , "success" : True } , status=status.HTTP_200_OK)
 
@@ -785,21 +1068,20 @@ class PasswordResetVerifyCodeAPI(APIView):
         
         if otp.is_expired():
             otp.used = True 
-            otp.save()
+            otp.save(update_fields=["used"])
             return Response(
                 {"message": "Code expired", "success": False},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        if otp.attempts >= 5:
+        if otp.attempts >= OTP_MAX_ATTEMPTS:
             return Response(
                 {"message": "Too many attempts", "success": False},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        if not check_password(code, otp.code_hash):
-            otp.attempts += 1
-            otp.save()
+        if not otp.check_code(code):
+            otp.record_failed_attempt()
             return Response(
                 {"message": "Invalid code", "success": False},
                 status=status.HTTP_400_BAD_REQUEST
@@ -841,15 +1123,20 @@ class PasswordResetConfirmAPI(APIView):
         
         if otp.is_expired():
             otp.used = True 
-            otp.save()
+            otp.save(update_fields=["used"])
             return Response(
                 {"message": "Code expired", "success": False},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        
-        if not check_password(code, otp.code_hash):
-            otp.attempts += 1
-            otp.save()
+
+        if otp.attempts >= OTP_MAX_ATTEMPTS:
+            return Response(
+                {"message": "Too many attempts", "success": False},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        if not otp.check_code(code):
+            otp.record_failed_attempt()
             return Response(
                 {"message": "Invalid code", "success": False},
                 status=status.HTTP_400_BAD_REQUEST
@@ -878,7 +1165,7 @@ class PasswordResetConfirmAPI(APIView):
         user.save()
 
         otp.used = True
-        otp.save()
+        otp.save(update_fields=["used"])
 
         return Response(
             {"message": "Password updated", "success": True},
@@ -893,10 +1180,8 @@ class CustomTokenRefreshSerializer(TokenRefreshSerializer):
         refresh = self.token_class(attrs['refresh'])
         user_id = refresh['user_id']
 
-        # Update last access
-        CustomUser.objects.filter(id=user_id).update(
-            last_active=timezone.now()
-        )
+        # Update last access (throttled)
+        touch_last_active(user_id)
 
         return data
 
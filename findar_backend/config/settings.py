@@ -15,6 +15,7 @@ from pathlib import Path
 import os
 from datetime import timedelta
 from decouple import config
+from django.core.exceptions import ImproperlyConfigured
 
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -42,6 +43,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'rest_framework_simplejwt',
     'api',
@@ -50,12 +52,15 @@ INSTALLED_APPS = [
 
 CRONJOBS = [
     ('0 10 * * *', 'api.cron.engagement_reminder'),
-    ('0 20 * * *', 'api.cron.subscription_renewal'),
+    ('0 * * * *', 'api.cron.check_almost_expired_boostings'),
+    ('*/15 * * * *', 'api.cron.expire_boostings'),
+    ('30 * * * *', 'api.cron.purge_password_reset_codes'),
 ]
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',  # if using JWT
+        # JWT , the user is built from the token claims (see api.authentication)
+        'api.authentication.StatelessJWTAuthentication',
     ),
 }
 
@@ -118,9 +123,68 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# every worker , the cron jobs and the queue workers must share the cache , an invalidation
+# made by one of them is otherwise never seen by the others (stale details and ETags)
+#   - REDIS_URL set : redis (recommended)
+#   - otherwise     : the database (run `python manage.py createcachetable` once) , the hit
+#                     counters are then buffered in each process and flushed once a minute
+# the per-process local memory cache is only allowed in DEBUG
+
+REDIS_URL = config('REDIS_URL', default='')
+CACHE_BACKEND = config('CACHE_BACKEND', default='redis' if REDIS_URL else 'database')
+
+if CACHE_BACKEND == 'redis':
+    if not REDIS_URL:
+        raise ImproperlyConfigured("CACHE_BACKEND=redis needs REDIS_URL")
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+elif CACHE_BACKEND == 'database':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'findar_cache',
+            # one entry per listing detail , search and user , the default (300) would cull constantly
+            'OPTIONS': {'MAX_ENTRIES': config('CACHE_MAX_ENTRIES', default=200_000, cast=int)},
+        }
+    }
+elif CACHE_BACKEND == 'locmem' and DEBUG:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'findar',
+        }
+    }
+else:
+    raise ImproperlyConfigured(f"unsupported CACHE_BACKEND {CACHE_BACKEND!r} (redis , database or locmem in DEBUG)")
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
+# hasher of the new passwords : pbkdf2 (default) , argon2 , bcrypt or scrypt
+# compare them with `manage.py benchmark_hashers` , existing hashes are upgraded on login
+PASSWORD_HASHER_PROFILE = config('PASSWORD_HASHER_PROFILE', default='pbkdf2')
+PBKDF2_ITERATIONS = config('PBKDF2_ITERATIONS', default=1_000_000, cast=int)  # django 5.2 default
+# every hasher stays listed so hashes made under another profile still verify ,
+# the profile's hasher comes first and hashes the new passwords
+PROFILE_HASHERS = {
+    'pbkdf2': 'api.hashers.ConfigurablePBKDF2PasswordHasher',  # also verifies the default pbkdf2_sha256 hashes
+    'argon2': 'django.contrib.auth.hashers.Argon2PasswordHasher',  # needs argon2-cffi
+    'bcrypt': 'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',  # needs bcrypt
+    'scrypt': 'django.contrib.auth.hashers.ScryptPasswordHasher',
+}
+if PASSWORD_HASHER_PROFILE not in PROFILE_HASHERS:
+    raise ImproperlyConfigured(f"PASSWORD_HASHER_PROFILE must be one of {', '.join(PROFILE_HASHERS)}")
+PASSWORD_HASHERS = [PROFILE_HASHERS[PASSWORD_HASHER_PROFILE]] + [
+    hasher for profile, hasher in PROFILE_HASHERS.items() if profile != PASSWORD_HASHER_PROFILE
+] + ['django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher']
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -142,8 +206,12 @@ SIMPLE_JWT = {
     "REFRESH_TOKEN_LIFETIME": timedelta(days=30),
     "ROTATE_REFRESH_TOKENS": True,
     "BLACKLIST_AFTER_ROTATION": False,
+    "TOKEN_OBTAIN_SERIALIZER": "api.authentication.UserTokenObtainPairSerializer",
 }
 
+# seconds a user loaded by api.authentication stays in the in-process cache
+JWT_USER_CACHE_TTL = 30
+
 
 
 # Internationalization
@@ -177,6 +245,9 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 MEDIA_URL = "/media/" 
 MEDIA_ROOT = BASE_DIR / "media"  
 
+# server key of the password reset codes HMAC (see PasswordResetOTP)
+OTP_HMAC_KEY = config('OTP_HMAC_KEY', default=SECRET_KEY)
+
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 EMAIL_HOST = 'smtp.gmail.com'
 EMAIL_USE_TLS = True